@@ -34,6 +34,8 @@ parser = argparse.ArgumentParser(
 parser.add_argument('-i', type=str, help="input TSV directory", default="NA")
 parser.add_argument('-o', type=str, help="output combined TSV file", default="NA")
 parser.add_argument('-b', type=str, help="bin name", default="NA")
+parser.add_argument('-d', type=str, help="handling of duplicate columns: drop (keep the first occurrence) or namespace (prefix with table name)", default="drop", choices=["drop", "namespace"])
+parser.add_argument('-f', type=str, help="output format: tsv, parquet or feather (default: by extension of output file, otherwise tsv)", default="auto", choices=["auto", "tsv", "parquet", "feather"])
 
 if len(sys.argv) == 1:
     parser.print_help(sys.stderr)
@@ -42,52 +44,103 @@ if len(sys.argv) == 1:
 args = parser.parse_known_args()[0]
 
 
+def read_table(file_path):
+    # read a table with contig IDs (first column) as index
+    df = pd.read_csv(file_path, sep='\t', index_col=0)
+    df.index = df.index.astype(str)
+    if not df.index.is_unique:
+        dups = df.index[df.index.duplicated()].unique()
+        print(f"Warning: {len(dups)} duplicate IDs in {file_path}, keeping the first occurrence.")
+        df = df[~df.index.duplicated()]
+    return df
+
+
+def check_index(index, df, name):
+    # report IDs of a table that do not agree with the basic table
+    missing = index.difference(df.index).size
+    extra = df.index.difference(index).size
+    if missing or extra:
+        print(f"Warning: {name} lacks {missing} IDs of the basic table, and has {extra} IDs not in it.")
+
+
+def dedup_columns(frames, names, mode):
+    # drop or namespace columns that already appeared in a previous table
+    seen = set()
+    res = []
+    for df, name in zip(frames, names):
+        dups = [c for c in df.columns if c in seen]
+        if dups:
+            if mode == "drop":
+                print(f"Dropped duplicate columns of {name}: {', '.join(dups)}")
+                df = df.drop(columns=dups)
+            else:
+                print(f"Renamed duplicate columns of {name}: {', '.join(dups)}")
+                df = df.rename(columns={c: name + "." + c for c in dups})
+        seen.update(df.columns)
+        res.append(df)
+    return res
+
+
 def combine_tsv_files(folder_path):
-    # basic_name = args.o + ".basic.tsv"
     print(args.b)
-    GODDAMNBIN = args.b
-    basic_name = lastItem(GODDAMNBIN.split("/")) + ".basic.tsv"
-    print(basic_name)
-    # realfolder_path = allButTheLast(args.b, "/")
-    print(folder_path)
-    # print(basic_name)
+    basic_name = lastItem(args.b.split("/")) + ".basic.tsv"
     basic_file_path = folder_path + "/" + basic_name
     print(basic_file_path)
-    print("+++++++++")
-    # print(basic_file_path)
 
     if not os.path.exists(basic_file_path):
         print(basic_file_path)
         raise FileNotFoundError("basic.tsv file is missing from the folder.")
 
-    basic_df = pd.read_csv(basic_file_path, sep='\t')
-    combined_df = basic_df.copy()
-
-    # Debugging
-    # print("Files in directory:", os.listdir(folder_path))
-    # print("Filtering for files containing:", args.b)
-
     BIN = os.path.basename(args.b)
-    tsv_files = [f for f in os.listdir(folder_path) if f.endswith('.tsv') and f != basic_name and BIN in f]
+    output = os.path.abspath(args.o)
+    tsv_files = sorted(f for f in os.listdir(folder_path) if f.endswith('.tsv') and f != basic_name and BIN in f
+                       and os.path.abspath(os.path.join(folder_path, f)) != output)
 
     print("Matched TSV files:", tsv_files)
 
+    # load every table indexed by contig ID, and check that IDs agree
+    basic_df = read_table(basic_file_path)
+    frames, names = [basic_df], ["basic"]
     for tsv_file in tsv_files:
         file_path = os.path.join(folder_path, tsv_file)
         print(file_path)
-        dissimilarity_df = pd.read_csv(file_path, sep='\t')
-        combined_df = pd.merge(combined_df, dissimilarity_df, on=combined_df.columns[0], how='left')
-
+        df = read_table(file_path)
+        check_index(basic_df.index, df, tsv_file)
+        frames.append(df.reindex(basic_df.index))
+        names.append(tsv_file[:-len('.tsv')])
+
+    # one aligned concatenation (rows of the basic table)
+    frames = dedup_columns(frames, names, args.d)
+    combined_df = pd.concat(frames, axis=1)
+    combined_df.index.name = basic_df.index.name
     return combined_df
 
 
+def write_output(df, output_file_path, fmt):
+    if fmt == "auto":
+        ext = os.path.splitext(output_file_path)[1].lower()
+        fmt = {".parquet": "parquet", ".pq": "parquet", ".feather": "feather", ".arrow": "feather"}.get(ext, "tsv")
+    if fmt == "tsv":
+        df.to_csv(output_file_path, sep='\t')
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ModuleNotFoundError:
+        sys.exit("Parquet and Feather output require Python library pyarrow.")
+    df = df.reset_index()
+    if fmt == "parquet":
+        df.to_parquet(output_file_path, index=False)
+    else:
+        df.to_feather(output_file_path)
+
+
 # Example usage:
 folder_path = args.i
 combined_df = combine_tsv_files(folder_path)
 
-# Save the combined data to a new TSV file
+# Save the combined data to a new file
 output_file_path = args.o
-combined_df.to_csv(output_file_path, sep='\t', index=False)
+write_output(combined_df, output_file_path, args.f)
 print(f"Combined file saved to {output_file_path}")
 
 
@@ -86,35 +86,17 @@ SEQS=$(grep -c "^>" ${INPUT})
 echo ""
 
 echo "python3 /home/ark/MAB/bin/HoundSleuth/sequence_basics.py -i ${INPUT} -o ${DIR}/basic.tsv"
-/home/ark/MAB/bin/HoundSleuth/sequence_basics.py -i ${INPUT} -o ${OUT}.basic.tsv
-/home/ark/MAB/bin/HoundSleuth/count_kmers.py -i ${INPUT} -k 5 | /home/ark/MAB/bin/HoundSleuth/reduce_dimension.py --pca --tsne --umap -o ${OUT}.k5 -f ${SEQS}
-/home/ark/MAB/bin/HoundSleuth/count_kmers.py -i ${INPUT} -k 4 | /home/ark/MAB/bin/HoundSleuth/reduce_dimension.py --pca --tsne --umap -o ${OUT}.k4 -f ${SEQS}
-/home/ark/MAB/bin/HoundSleuth/count_kmers.py -i${INPUT} -k 6 | /home/ark/MAB/bin/HoundSleuth/reduce_dimension.py --pca --tsne --umap -o ${OUT}.k6 -f ${SEQS}
+/home/ark/MAB/bin/HoundSleuth/sequence_basics.py -i ${INPUT} -o ${OUT}.basic.tsv -S ${OUT}.assembly_stats.json
+/home/ark/MAB/bin/HoundSleuth/count_kmers.py -i ${INPUT} -k 4 5 6 -t 16 -f bin -o ${OUT}.kmers
+/home/ark/MAB/bin/HoundSleuth/reduce_dimension.py -i ${OUT}.kmers.k4.kmat ${OUT}.kmers.k5.kmat ${OUT}.kmers.k6.kmat \
+    -o ${OUT}.k4 ${OUT}.k5 ${OUT}.k6 -x 4 5 6 --pca --tsne --umap -t 16 -f ${SEQS}
+rm -f ${OUT}.kmers.k4.kmat ${OUT}.kmers.k5.kmat ${OUT}.kmers.k6.kmat
 
 #count_kmers.py f-i ${INPUT} -k 5 | reduce_dimension.py --pca --tsne --umap -o ${OUT}.k5
 #count_kmers.py -i ${INPUT} -k 4 | reduce_dimension.py --pca --tsne --umap -o ${OUT}.k4
 #count_kmers.py -i ${INPUT} -k 6 | reduce_dimension.py --pca --tsne --umap -o ${OUT}.k6
 
-pca4=$(printf "ID\t4PC1\t4PC2")
-pca5=$(printf "ID\t5PC1\t5PC2")
-pca6=$(printf "ID\t6PC1\t6PC2")
-tsne4=$(printf "ID\t4tsne1\t4tsne2")
-tsne5=$(printf "ID\t5tsne1\t5tsne2")
-tsne6=$(printf "ID\t6tsne1\t6tsne2")
-umap4=$(printf "ID\t4UM1\t4UM2")
-umap5=$(printf "ID\t5UM1\t5UM2")
-umap6=$(printf "ID\t6UM1\t6UM2")
-
 echo $OUT
-sed -i "1c $pca4" ${OUT}.k4.pca.tsv
-sed -i "1c $pca5" ${OUT}.k5.pca.tsv
-sed -i "1c $pca6" ${OUT}.k6.pca.tsv
-sed -i "1c $tsne4" ${OUT}.k4.tsne.tsv
-sed -i "1c $tsne5" ${OUT}.k5.tsne.tsv
-sed -i "1c $tsne6" ${OUT}.k6.tsne.tsv
-sed -i "1c $umap4" ${OUT}.k4.umap.tsv
-sed -i "1c $umap5" ${OUT}.k5.umap.tsv
-sed -i "1c $umap6" ${OUT}.k6.umap.tsv
 
 #files=("${OUT}"*.tsv)
 #cp "${files[0]}" binarena_input.tsv
@@ -128,6 +110,13 @@ sed -i "1c $umap6" ${OUT}.k6.umap.tsv
 echo "python3 /home/ark/MAB/bin/HoundSleuth/binarena-combine.py -i ${DIR} -o ${OUT}.tsv -b ${OUT}"
 /home/ark/MAB/bin/HoundSleuth/binarena-combine.py -i ${DIR} -o ${OUT}.tsv -b ${BASE}
 
+# draft bins by clustering embeddings (and coverage), as input for plan2bin.py
+if [[ ${DEPTH} != false ]]; then
+    /home/ark/MAB/bin/HoundSleuth/cluster_bins.py -i ${OUT}.tsv -d ${DEPTH} -m ${MIN} -t 16 -o ${OUT}.bins.tsv
+else
+    /home/ark/MAB/bin/HoundSleuth/cluster_bins.py -i ${OUT}.tsv -m ${MIN} -t 16 -o ${OUT}.bins.tsv
+fi
+
 if [[ ${RANK} == genus ]]; then
     if [[ ${SNP} != false ]]; then
         if [[ ${DEPTH} != false ]]; then
@@ -1,196 +1,351 @@
 #!/usr/bin/env python
-from collections import defaultdict
+import os
 import re
-import argparse
-import numpy as np
+import csv
 import sys
+import argparse
 import textwrap
-# from ArkTools import *
-
-def Sum(ls):
-    count = 0
-    for i in ls:
-        count += float(i)
-    return count
-
-def derep(ls):
-    outLS = []
-    for i in ls:
-        if i not in outLS:
-            outLS.append(i)
-    return outLS
-
-
-def ribosome(seq):
-    NTs = ['T', 'C', 'A', 'G']
-    stopCodons = ['TAA', 'TAG', 'TGA']
-    Codons = []
-    for i in range(4):
-        for j in range(4):
-            for k in range(4):
-                codon = NTs[i] + NTs[j] + NTs[k]
-                # if not codon in stopCodons:
-                Codons.append(codon)
-
-    CodonTable = {}
-    AAz = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
-    AAs = list(AAz)
-    k = 0
-    for base1 in NTs:
-        for base2 in NTs:
-            for base3 in NTs:
-                codon = base1 + base2 + base3
-                CodonTable[codon] = AAs[k]
-                k += 1
-
-    prot = []
-    for j in range(0, len(seq), 3):
-        codon = seq[j:j + 3]
-        try:
-            prot.append(CodonTable[codon])
-        except KeyError:
-            prot.append("")
-    protein = ("".join(prot))
-    return protein, CodonTable
-
-
-def fasta(fasta_file):
-    count = 0
-    seq = ''
-    header = ''
-    Dict = defaultdict(lambda: defaultdict(lambda: 'EMPTY'))
-    for i in fasta_file:
-        i = i.rstrip()
-        if re.match(r'^>', i):
-            count += 1
-            if count % 1000000 == 0:
-                print(count)
-
-            if len(seq) > 0:
-                Dict[header] = seq
-                header = i[1:]
-                header = header.split(" ")[0]
-                seq = ''
-            else:
-                header = i[1:]
-                header = header.split(" ")[0]
-                seq = ''
-        else:
-            seq += i
-    Dict[header] = seq
-    # print(count)
-    return Dict
-
-
-parser = argparse.ArgumentParser(
-    prog="YfGenie.py",
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    description=textwrap.dedent('''
-    *******************************************************
-
-    Developed by Arkadiy Garber;
-    Arizona State University
-    Please send comments and inquiries to agarber4@asu.edu
-
-    *******************************************************
-    '''))
-
-parser.add_argument('-s', type=str, help="spraynpray output summary table",
-                    default="")
-
-parser.add_argument('-d', type=str, help="coverage information from jgi_summarize_bam_contig_depths", default="NA")
-
-parser.add_argument('-b', type=str, help="binarena input table", default="")
-
-parser.add_argument('-m', type=str, help="minimum contig depth", default=1000)
-
-parser.add_argument('-o', type=str, help="output file", default="binstager")
-
-parser.add_argument('-f', type=str, help="fasta file", default="NA")
-
-parser.add_argument('-x', type=str, help="fasta output", default="NA")
-
-if len(sys.argv) == 1:
-    parser.print_help(sys.stderr)
-    sys.exit(0)
-
-args = parser.parse_known_args()[0]
-
-contigs = open(args.f)
-contigs = fasta(contigs)
-
-splitDict = defaultdict(list)
-summaryDict = defaultdict(lambda: '-')
-summary = open(args.s)
-for i in summary:
-    ls = i.rstrip().split(",")
-    if ls[1] != "contig_length":
-        if float(ls[1]) > float(args.m):
-            if len(ls[6]) > 1:
-                taxa = (ls[6].split("; "))
-                taxaDict = defaultdict(list)
-
-                for j in taxa:
-                    tax = (j.split(" ")[0])
-                    tax = tax.split(";")[0]
-                    if tax in ["uncultured", "unclassified", "unknown", "", "bacterium", "glutamine",
-                               "glutamine-hydrolyzing", "2Fe-2S", "NADP", "NADH", "glutamate--ammonia",
-                               "acetyl-CoA-carboxylase", "protein-PII", "Bacteria", "bacterium", "Bacterium",
-                               "bacteria", "Gammaproteobacteria", "Pseudomonadota", "acyl-carrier-protein",
-                               "dsDNA", "Prokaryotic", "NAD(P)H"]:
-                        tax = "unclassified"
-
-                    elif tax == "Candidatus":
-                        tax = j.split(" ")[0] + "." + j.split(" ")[1]
-
-                    elif tax == "candidate":
-                        tax = j.split(" ")[0] + "." + j.split(" ")[1] + "." + j.split(" ")[2]
-
-                    taxaDict[tax].append(tax)
-
-                taxaDict2 = defaultdict(lambda: '-')
-                for j in taxaDict.keys():
-                    taxaDict2[j] = len(taxaDict[j])
-
-                v = list(taxaDict2.values())
-                k = list(taxaDict2.keys())
-                winningTaxa = "unclassified"
-                if len(v) != 0:
-                    classified_keys = [k for k in taxaDict2 if k != "unclassified"]
-                    if classified_keys:
-                        winningTaxa = max(classified_keys, key=taxaDict2.get)
-                    else:
-                        winningTaxa = 'unclassified'
-
-                summaryDict[ls[0].split(" ")[0]] = winningTaxa
-                splitDict[winningTaxa].append(ls[0].split(" ")[0])
-                print(ls[0], winningTaxa)
-
-
-depthsDict = defaultdict(lambda: '-')
-if args.d != "NA":
-    depths = open(args.d)
-    for i in depths:
+import unittest
+from functools import lru_cache
+from collections import Counter, defaultdict
+from fasta_reader import read_fasta, load_index, copy_sequence
+
+
+# taxon ranks that votes can be counted for
+RANKS = ("genus", "species")
+
+# genus tokens that do not name a genus
+GENUS_JUNK = frozenset([
+    "uncultured", "unclassified", "unknown", "", "bacterium", "glutamine",
+    "glutamine-hydrolyzing", "2Fe-2S", "NADP", "NADH", "glutamate--ammonia",
+    "acetyl-CoA-carboxylase", "protein-PII", "Bacteria", "Bacterium",
+    "bacteria", "Gammaproteobacteria", "Pseudomonadota", "acyl-carrier-protein",
+    "dsDNA", "Prokaryotic", "NAD(P)H"])
+
+# species epithets that do not name a species
+SPECIES_JUNK = frozenset([
+    "sp.", "bacterium", "synthetase", "taxa", "group", "", "L-lysine-forming",
+    "prokaryote", "dsDNA", "NAD(P)H"])
+
+# separator of hits in the taxa column
+HITS = re.compile(r"; ")
+
+
+def genus_token(hit):
+    """Extract the genus of a hit.
+
+    Parameters
+    ----------
+    hit : str
+        Taxon name of a hit.
+
+    Returns
+    -------
+    str
+        Genus, joined with "Candidatus" or "candidate division" by dots if
+        applicable, or "unclassified" if not informative.
+    """
+    words = hit.split(" ")
+    tax = words[0].split(";")[0]
+    if tax in GENUS_JUNK:
+        return "unclassified"
+    if tax == "Candidatus":
+        return ".".join(words[:2])
+    if tax == "candidate":
+        return ".".join(words[:3])
+    return tax
+
+
+def species_token(hit):
+    """Extract the species epithet of a hit.
+
+    Parameters
+    ----------
+    hit : str
+        Taxon name of a hit.
+
+    Returns
+    -------
+    str or None
+        Species epithet, or None if not informative.
+    """
+    words = hit.split(" ")
+    if len(words) < 2:
+        return None
+    tax = words[1].split(";")[0]
+    if tax in SPECIES_JUNK or tax[0].isupper():
+        return None
+    return tax
+
+
+# token of each rank that never wins
+SKIP = {"genus": "unclassified", "species": None}
+
+
+@lru_cache(maxsize=65536)
+def hit_tokens(hit):
+    """Parse a hit into its tokens at all ranks.
+
+    Parameters
+    ----------
+    hit : str
+        Taxon name of a hit.
+
+    Returns
+    -------
+    tuple of str
+        Genus and species tokens (see `genus_token` and `species_token`).
+
+    Notes
+    -----
+    Results are cached, as the same hits recur across contigs.
+    """
+    return genus_token(hit), species_token(hit)
+
+
+def vote(taxa, ranks):
+    """Find the winning taxon of a contig at each rank.
+
+    Parameters
+    ----------
+    taxa : str
+        Taxa column of SprayNPray output (hits separated by "; ").
+    ranks : list of str
+        Taxon ranks.
+
+    Returns
+    -------
+    list of str
+        Most frequent informative taxon at each rank (ties are broken by first
+        occurrence), or "unclassified".
+
+    Notes
+    -----
+    Each hit is parsed once into its tokens at all ranks, which are counted
+    for all requested ranks in the same pass.
+    """
+    cols = [RANKS.index(x) for x in ranks]
+    counts = [Counter() for _ in ranks]
+    for hit in HITS.split(taxa):
+        tokens = hit_tokens(hit)
+        for i, count in zip(cols, counts):
+            count[tokens[i]] += 1
+    res = []
+    for rank, count in zip(ranks, counts):
+        count.pop(SKIP[rank], None)
+        res.append(max(count, key=count.get) if count else "unclassified")
+    return res
+
+
+def read_summary(fp, ranks, minimum):
+    """Read SprayNPray output and vote for taxa of contigs.
+
+    Parameters
+    ----------
+    fp : str
+        SprayNPray output summary table (CSV).
+    ranks : list of str
+        Taxon ranks.
+    minimum : float
+        Contigs not longer than this are skipped.
+
+    Returns
+    -------
+    dict of str: list of str
+        Winning taxa at each rank per contig.
+
+    Notes
+    -----
+    Each contig is reported to stdout in the format of the original tool of
+    the rank: "{contig} {taxon}" (genus), "Contig: {contig} Taxa: {taxon}
+    Length: {length}" (species), or the latter with taxa of all ranks joined
+    by ", " (multiple ranks).
+    """
+    res = {}
+    with open(fp, newline="") as f:
+        for ls in csv.reader(f):
+            if len(ls) < 7 or ls[1] == "contig_length":
+                continue
+            if float(ls[1]) > minimum and len(ls[6]) > 1:
+                contig = ls[0].split(" ")[0]
+                res[contig] = vote(ls[6], ranks)
+                if ranks == ["genus"]:
+                    print(ls[0], res[contig][0])
+                else:
+                    print("Contig: " + contig + " Taxa: " + ", ".join(res[contig]) + " Length: " + ls[1])
+    return res
+
+
+def write_bins(fp, bins):
+    """Write contigs of each bin from a FASTA file.
+
+    Parameters
+    ----------
+    fp : str
+        Input multi-FASTA file.
+    bins : dict of str: list of str
+        Output FASTA file and member contigs of each bin.
+
+    Notes
+    -----
+    Contigs are copied from the file using its index (built once, and cached
+    beside the file), such that memory usage does not depend on assembly size.
+    If the file cannot be indexed (compressed, or with irregular line
+    wrapping), it is read once and contigs are written as they come.
+    """
+    index = load_index(fp)
+    if index is not None:
+        with open(fp, "rb") as src:
+            for path, members in bins.items():
+                with open(path, "wb") as out:
+                    for j in members:
+                        if index.get(j, (0,))[0]:
+                            out.write(b">" + j.encode() + b"\n")
+                            copy_sequence(src, out, index[j])
+        return
+
+    # streaming fallback
+    where = defaultdict(list)
+    for path, members in bins.items():
+        for j in members:
+            where[j].append(path)
+    outs = {path: open(path, "wb") for path in bins}
+    with open(fp, "rb") as f:
+        for title, seq in read_fasta(f):
+            name = (title.split(None, 1) or [""])[0]
+            if seq and name in where:
+                for path in where[name]:
+                    outs[path].write(b">" + name.encode() + b"\n" + seq + b"\n")
+    for out in outs.values():
+        out.close()
+
+
+def main(rank="genus"):
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent('''
+        *******************************************************
+
+        Developed by Arkadiy Garber;
+        Arizona State University
+        Please send comments and inquiries to agarber4@asu.edu
+
+        Votes for the taxon of each contig among its SprayNPray hits, at one
+        or more ranks in one pass (-r genus species), appends depth and taxa
+        to the binarena table, and writes contigs of each taxon to a FASTA
+        file ({x}.{taxon}.fa, or {x}.{rank}.{taxon}.fa for multiple ranks).
+
+        *******************************************************
+        '''))
+
+    parser.add_argument('-s', type=str, help="spraynpray output summary table",
+                        default="")
+
+    parser.add_argument('-d', type=str, help="coverage information from jgi_summarize_bam_contig_depths", default="NA")
+
+    parser.add_argument('-b', type=str, help="binarena input table", default="")
+
+    parser.add_argument('-m', type=str, help="minimum contig depth", default=1000)
+
+    parser.add_argument('-o', type=str, help="output file", default="binstager")
+
+    parser.add_argument('-f', type=str, help="fasta file", default="NA")
+
+    parser.add_argument('-x', type=str, help="fasta output", default="NA")
+
+    parser.add_argument('-r', type=str, nargs="+", choices=RANKS, help="taxon rank(s), default: " + rank, default=[rank])
+
+    parser.add_argument('--store', type=str, help="feature store directory (also write depth and taxa as column group \"taxa\")", default="NA")
+
+    if len(sys.argv) == 1:
+        parser.print_help(sys.stderr)
+        sys.exit(0)
+
+    args = parser.parse_known_args()[0]
+    ranks = list(dict.fromkeys(args.r))
+
+    # taxa column per rank ("taxa" if only one rank)
+    columns = ["taxa"] if len(ranks) == 1 else ["taxa_" + x for x in ranks]
+
+    summaryDict = read_summary(args.s, ranks, float(args.m))
+
+    depthsDict = defaultdict(lambda: '-')
+    if args.d != "NA":
+        depths = open(args.d)
+        for i in depths:
+            ls = i.rstrip().split("\t")
+            depthsDict[ls[0]] = ls[2]
+
+    out = open(args.o, "w")
+    binarena = open(args.b)
+    for i in binarena:
         ls = i.rstrip().split("\t")
-        depthsDict[ls[0]] = ls[2]
-
-out = open(args.o, "w")
-binarena = open(args.b)
-for i in binarena:
-    ls = i.rstrip().split("\t")
-    if ls[0] != "ID":
-        if ls[0] in summaryDict.keys():
-            out.write(i.rstrip() + "\t" + str(depthsDict[ls[0]]) + "\t" + str(summaryDict[ls[0]]) + "\n")
-    else:
-        out.write(i.rstrip() + "\tdepth\ttaxa\n")
-out.close()
-
-print("\n\n\n")
-for i in splitDict.keys():
-    out = open(args.x + "." + i + ".fa", "w")
-    for j in splitDict[i]:
-        print(j)
-        if j in contigs.keys():
-            out.write(">" + j + "\n" + str(contigs[j]) + "\n")
+        if ls[0] != "ID":
+            if ls[0] in summaryDict:
+                out.write("\t".join([i.rstrip(), str(depthsDict[ls[0]])] + summaryDict[ls[0]]) + "\n")
+        else:
+            out.write("\t".join([i.rstrip(), "depth"] + columns) + "\n")
     out.close()
 
+    if args.store != "NA":
+        import pandas as pd
+        from feature_store import write_group
+        store = pd.DataFrame(list(summaryDict.values()), columns=columns, index=list(summaryDict.keys()))
+        store.insert(0, "depth", pd.to_numeric([depthsDict[i] for i in summaryDict.keys()], errors="coerce"))
+        write_group(args.store, "taxa", store)
+
+    # write contigs of each taxon at each rank
+    bins = defaultdict(list)
+    for r, rank in enumerate(ranks):
+        prefix = args.x if len(ranks) == 1 else args.x + "." + rank
+        for contig, taxa in summaryDict.items():
+            bins[prefix + "." + taxa[r] + ".fa"].append(contig)
+    write_bins(args.f, bins)
+
+
+class Tests(unittest.TestCase):
+    def test_vote(self):
+        taxa = ("Thermus sp.; uncultured bacterium; Bacillus subtilis; "
+                "Bacillus cereus; Thermus aquaticus; Thermus aquaticus")
+        self.assertListEqual(vote(taxa, ["genus", "species"]),
+                             ["Thermus", "aquaticus"])
+
+        # ties are broken by first occurrence
+        taxa = "Bacillus subtilis; Thermus aquaticus"
+        self.assertListEqual(vote(taxa, ["species", "genus"]),
+                             ["subtilis", "Bacillus"])
+
+        # special genus names, and uninformative hits
+        taxa = "Candidatus Pelagibacter ubique; candidate division WPS-1"
+        self.assertListEqual(vote(taxa, ["genus"]),
+                             ["Candidatus.Pelagibacter"])
+        taxa = "uncultured bacterium; Bacteria; NADH dehydrogenase"
+        self.assertListEqual(vote(taxa, RANKS),
+                             ["unclassified", "dehydrogenase"])
+        taxa = "Bacteria; Thermus sp.; Thermus"
+        self.assertListEqual(vote(taxa, RANKS), ["Thermus", "unclassified"])
+
+    def test_read_summary(self):
+        import tempfile
+        from contextlib import redirect_stdout
+        from io import StringIO
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write("contig,contig_length,a,b,c,d,taxa\n"
+                    "c1 desc,5000,,,,,Thermus aquaticus; Thermus sp.\n"
+                    "c2,500,,,,,Bacillus subtilis\n")
+            f.flush()
+            for ranks, exp in (
+                    (["genus"], "c1 desc Thermus\n"),
+                    (["species"], "Contig: c1 Taxa: aquaticus Length: 5000\n"),
+                    (list(RANKS), "Contig: c1 Taxa: Thermus, aquaticus "
+                                  "Length: 5000\n")):
+                out = StringIO()
+                with redirect_stdout(out):
+                    obs = read_summary(f.name, ranks, 1000)
+                self.assertListEqual(list(obs), ["c1"])
+                self.assertEqual(out.getvalue(), exp)
+
+
+if __name__ == "__main__":
+    main()
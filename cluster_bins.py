@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""Cluster contigs into draft bins based on embeddings and coverage.
+
+Usage:
+    python me.py -i binarena.tsv -d depth.txt -o bins.tsv
+    python me.py -i binarena.tsv -e 0.3 -o bins.tsv
+    python me.py -i binarena.tsv -a hdbscan -o bins.tsv
+
+Output:
+    A tab-separated table of contig identifiers and bin names (without a
+    header), which can be fed to plan2bin.py. Unclustered contigs are listed
+    with an empty bin name.
+
+Input:
+    A tab-separated table with contig identifiers in the first column, such as
+    the output of binarena-combine.py. By default, PCA and UMAP columns (e.g.,
+    4PC1, 5UM2, UMAP1) are used as features. Alternatively, columns may be
+    selected by a regular expression (-c).
+
+    Coverage profiles may be provided as the output of
+    jgi_summarize_bam_contig_depths (-d), or as a "depth" column of the input
+    table. Contigs with missing values are not clustered.
+
+Notes:
+    Features are log-transformed (coverage only) and standardized to zero mean
+    and unit variance, such that they contribute equally to the distances.
+
+    Contigs are clustered using DBSCAN (default) or HDBSCAN, both density-
+    based algorithms that do not require the number of clusters, and that
+    leave contigs in sparse regions unclustered. DBSCAN performs radius
+    queries on a k-d tree, such that run time scales close to n log n for a
+    small radius (-e) in low dimensions. HDBSCAN does not require a radius,
+    but builds a minimum spanning tree of all contigs, which takes O(n^2) time
+    and is slow for large assemblies.
+
+    Contigs shorter than a minimum length (-m) are not clustered. Lengths are
+    read from the "length" column of the input table, or from the depth file.
+
+    Bins are named by a prefix (default: "bin_") and a serial number, in
+    descending order of total length of member contigs (or of number of
+    contigs if lengths are not available).
+
+    It requires the Python library scikit-learn (1.3 or above for HDBSCAN).
+"""
+
+import re
+import sys
+import argparse
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+# default pattern of feature columns: PCA and UMAP
+FEATURES = r'^\d*(PC|UM|UMAP)\d+$'
+
+
+def parse_args():
+    """Command-line interface.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg = parser.add_argument
+    arg('-i', '--input', type=argparse.FileType('r'), default=sys.stdin,
+        help='input table (e.g., output of binarena-combine.py), '
+             'default: stdin')
+    arg('-o', '--output', type=argparse.FileType('w'), required=True,
+        help='output contig-to-bin table')
+    arg('-d', '--depth', type=str,
+        help='coverage table generated by jgi_summarize_bam_contig_depths')
+    arg('-c', '--columns', type=str, default=FEATURES,
+        help='regular expression of feature columns, default: PCA and UMAP')
+    arg('-a', '--algorithm', type=str, default='dbscan',
+        choices=['dbscan', 'hdbscan'],
+        help='clustering algorithm, default: dbscan')
+    arg('-s', '--min-size', type=int, default=10,
+        help='minimum number of contigs per cluster (HDBSCAN), and minimum '
+             'number of neighbors of a core contig (DBSCAN), default: 10')
+    arg('-e', '--eps', type=float, default=0.5,
+        help='neighborhood radius of standardized features (DBSCAN), '
+             'default: 0.5')
+    arg('-m', '--min-length', type=int, default=0,
+        help='minimum length of contigs to cluster, default: 0')
+    arg('-p', '--prefix', type=str, default='bin_',
+        help='prefix of bin names, default: bin_')
+    arg('-t', '--threads', type=int, default=1,
+        help='number of threads, default: 1')
+    for arg in parser._actions:
+        arg.metavar = ''
+    if len(sys.argv) == 1:
+        print(__doc__)
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # read input table
+    df = pd.read_table(args.input, index_col=0)
+    df.index = df.index.astype(str)
+    print(f'Input table has {df.shape[0]} contigs.')
+
+    # select feature columns
+    try:
+        cols = [x for x in df.columns if re.search(args.columns, x)]
+    except re.error:
+        exit(f'Invalid regular expression: {args.columns}.')
+    if not cols:
+        exit('No feature column is found in input table.')
+    features = [df[cols].apply(pd.to_numeric, errors='coerce')]
+    lengths = df['length'] if 'length' in df.columns else None
+
+    # read coverage
+    if args.depth:
+        depth, lengths_ = read_depth(args.depth)
+        depth = depth.reindex(df.index)
+        if depth.isna().all(axis=None):
+            exit('No contig in input table is found in depth file.')
+        cols += depth.columns.tolist()
+        features.append(np.log1p(depth))
+        if lengths is None:
+            lengths = lengths_.reindex(df.index)
+    elif 'depth' in df.columns:
+        depth = pd.to_numeric(df['depth'], errors='coerce')
+        if depth.notna().any():
+            cols.append('depth')
+            features.append(np.log1p(depth))
+    print(f'Features: {", ".join(cols)}.')
+    data = pd.concat(features, axis=1)
+
+    # filter contigs
+    keep = data.notna().all(axis=1).values
+    if args.min_length:
+        if lengths is None:
+            exit('Contig lengths are not available.')
+        keep &= (lengths.fillna(0).values >= args.min_length)
+    print(f'Clustering {keep.sum()} contigs...')
+
+    # cluster contigs
+    labels = np.full(df.shape[0], -1)
+    if keep.any():
+        X = standardize(data.values[keep])
+        labels[keep] = cluster(X, args.algorithm, args.min_size, args.eps,
+                               args.threads)
+    weights = None if lengths is None else lengths.fillna(0).values
+    names = name_bins(labels, weights, args.prefix)
+    nbin = len(set(names) - {''})
+    nbinned = sum(1 for x in names if x)
+    print(f'Clustered {nbinned} contigs into {nbin} bins.')
+
+    # write contig-to-bin map
+    with args.output as f:
+        for contig, name in zip(df.index, names):
+            print(f'{contig}\t{name}', file=f)
+
+
+def read_depth(fp):
+    """Read a coverage table generated by jgi_summarize_bam_contig_depths.
+
+    Parameters
+    ----------
+    fp : str
+        Coverage table file.
+
+    Returns
+    -------
+    pd.DataFrame
+        Mean depth of each contig (row) in each sample (column), or total
+        average depth if there is only one sample.
+    pd.Series
+        Contig lengths.
+    """
+    df = pd.read_table(fp, index_col=0)
+    df.index = df.index.astype(str)
+    samples = [x for x in df.columns[2:] if not x.endswith('-var')]
+    if len(samples) < 2:
+        samples = ['totalAvgDepth']
+    return df[samples].astype(float), df['contigLen']
+
+
+def standardize(X):
+    """Scale features to zero mean and unit variance.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Data table.
+
+    Returns
+    -------
+    np.ndarray
+        Standardized data table.
+    """
+    X = X - X.mean(axis=0)
+    sd = X.std(axis=0)
+    sd[sd == 0] = 1
+    return X / sd
+
+
+def cluster(X, algorithm='dbscan', min_size=10, eps=0.5, n_jobs=1):
+    """Perform density-based clustering using a k-d tree.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Data table.
+    algorithm : {'dbscan', 'hdbscan'}, optional
+        Clustering algorithm.
+    min_size : int, optional
+        Minimum cluster size (HDBSCAN) or minimum number of neighbors of a
+        core sample (DBSCAN).
+    eps : float, optional
+        Neighborhood radius (DBSCAN).
+    n_jobs : int, optional
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray of int
+        Cluster labels (-1 for unclustered samples).
+    """
+    if algorithm == 'hdbscan':
+        try:
+            from sklearn.cluster import HDBSCAN
+        except ImportError:
+            exit('HDBSCAN requires Python library scikit-learn 1.3 or above.')
+        if X.shape[0] < 2:
+            return np.full(X.shape[0], -1)
+        model = HDBSCAN(min_cluster_size=max(2, min(min_size, X.shape[0])),
+                        algorithm='kd_tree', n_jobs=n_jobs, copy=False)
+    else:
+        from sklearn.cluster import DBSCAN
+        model = DBSCAN(eps=eps, min_samples=min_size, algorithm='kd_tree',
+                       n_jobs=n_jobs)
+    return model.fit_predict(X)
+
+
+def name_bins(labels, weights=None, prefix='bin_'):
+    """Name clusters in descending order of size.
+
+    Parameters
+    ----------
+    labels : array_like of int
+        Cluster labels (-1 for unclustered samples).
+    weights : array_like of float, optional
+        Weights of samples (e.g., contig lengths). If omitted, samples are
+        counted.
+    prefix : str, optional
+        Prefix of bin names.
+
+    Returns
+    -------
+    list of str
+        Bin name of each sample (empty for unclustered samples).
+    """
+    labels = np.asarray(labels)
+    if weights is None:
+        weights = np.ones(labels.shape[0])
+    sizes = {}
+    for label, weight in zip(labels.tolist(), weights):
+        if label >= 0:
+            sizes[label] = sizes.get(label, 0) + weight
+    order = sorted(sizes, key=lambda x: (-sizes[x], x))
+    names = {x: f'{prefix}{i + 1}' for i, x in enumerate(order)}
+    return [names.get(x, '') for x in labels.tolist()]
+
+
+class Tests(unittest.TestCase):
+    def test_name_bins(self):
+        obs = name_bins([0, 1, 1, -1, 2], [100, 10, 20, 500, 50])
+        self.assertListEqual(obs, ['bin_1', 'bin_3', 'bin_3', '', 'bin_2'])
+        obs = name_bins([1, 0, 0], prefix='B')
+        self.assertListEqual(obs, ['B2', 'B1', 'B1'])
+
+    def test_cluster(self):
+        rng = np.random.default_rng(42)
+        X = np.concatenate([rng.normal(0, 0.1, (50, 2)),
+                            rng.normal(5, 0.1, (30, 2)),
+                            [[20.0, -20.0]]])
+        for algorithm in ('hdbscan', 'dbscan'):
+            obs = cluster(X, algorithm, min_size=5, eps=0.5)
+            self.assertEqual(len(set(obs[:50])), 1)
+            self.assertEqual(len(set(obs[50:80])), 1)
+            self.assertNotEqual(obs[0], obs[50])
+            self.assertEqual(obs[80], -1)
+
+    def test_main(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from shutil import rmtree
+        from unittest import mock
+        rng = np.random.default_rng(42)
+        X = np.concatenate([rng.normal(0, 0.1, (20, 2)),
+                            rng.normal(5, 0.1, (20, 2))])
+        ids = [f'c{i}' for i in range(40)]
+        tmpdir = tempfile.mkdtemp()
+        fi, fd, fo = (os.path.join(tmpdir, x) for x in (
+            'in.tsv', 'depth.txt', 'out.tsv'))
+        try:
+            pd.DataFrame(X, index=pd.Index(ids, name='ID'), columns=[
+                'PC1', 'PC2']).to_csv(fi, sep='\t')
+
+            # contigs missing from depth file are not clustered
+            # (c0 would join c1-c19 if its depth were taken as zero)
+            depth = [0.0] * 19 + [10.0] * 20
+            pd.DataFrame({'contigLen': 1000, 'totalAvgDepth': depth,
+                          's1': depth, 's1-var': 1.0}, index=pd.Index(
+                ids[1:], name='contigName')).to_csv(fd, sep='\t')
+            argv = ['me.py', '-i', fi, '-d', fd, '-o', fo, '-s', '5']
+            with mock.patch('sys.argv', argv), mock.patch(
+                    'sys.stdout', new=StringIO()):
+                main()
+            obs = pd.read_table(fo, header=None, index_col=0,
+                                keep_default_na=False)[1]
+        finally:
+            rmtree(tmpdir)
+        self.assertEqual(obs['c0'], '')
+        self.assertEqual(len(set(obs[ids[1:20]])), 1)
+        self.assertEqual(len(set(obs[ids[20:]])), 1)
+        self.assertNotEqual(obs['c1'], obs['c20'])
+        self.assertNotIn('', set(obs[ids[1:]]))
+
+    def test_standardize(self):
+        obs = standardize(np.array([[1.0, 5.0], [3.0, 5.0]]))
+        self.assertListEqual(obs.tolist(), [[-1.0, 0.0], [1.0, 0.0]])
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 Examples:
     python me.py -i input.fna -k 4 -o output.tsv
     zcat input.fna.gz | python me.py -k 5 | gzip > output.tsv.gz
+    python me.py -i input.fna -k 4 5 6 -o output
 
 Notes:
     This is an exact k-mer counter. The frequencies of all k-mers will be
@@ -13,17 +14,71 @@ Notes:
     The output is a tab-separated table with rows as sequence identifiers and
     columns as all possible k-mers (including unobserved ones).
 
+    Multiple k-values may be specified, in which case the input is read and
+    encoded only once, and one table per k-value is written to output.k4.tsv,
+    output.k5.tsv, etc., where "output" is the output filepath stem.
+
+    In canonical mode, each k-mer and its reverse complement, which always
+    have the same frequency, are reported as one column, labeled by the
+    lexicographically smaller one. Palindromic k-mers are reported as is. This
+    nearly halves the number of columns (e.g., 2080 instead of 4096 for k = 6).
+
+    With multiple threads, sequences are dispatched to a pool of processes in
+    batches of a given total length, while the main process keeps reading
+    input and writing output. Rows are written in the original input order, so
+    the output is identical to that of a single-threaded run.
+
+    The output may alternatively be written in a binary format (see
+    kmer_matrix.py), which can be memory-mapped by reduce_dimension.py without
+    parsing. Multiple k-values are written to output.k4.kmat, etc.
+
+    Alternatively, k-mer frequencies may be written as column groups kmers.k4,
+    kmers.k5, etc. of a feature store (-f store -o store_dir; see
+    feature_store.py).
+
     Note: This k-mer counter is optimized for small k-values (k = 4, 5, 6...)
     and many sequences, which are typical for the task of contig binning. It
     is not efficient for large k-values (e.g., k = 35).
 
+    Optionally, for k-values above a given threshold (e.g., -s 8), only
+    observed k-mers are counted and reported (sparse mode), since a table of
+    all 4^k k-mers is no longer practical. The output is a tab-separated
+    table with one row per sequence and observed k-mer (ID, k-mer, count), or
+    a compressed sparse row (CSR) binary matrix of k-mer codes (see
+    kmer_matrix.py). Sparse mode requires NumPy and supports k-values up to
+    31.
+
+    In window mode, k-mer frequencies are reported for windows of a fixed size
+    sliding along each sequence by a given step, with rows labeled by
+    "ID:start-end" (1-based, inclusive). If the windows do not reach the end
+    of a sequence, a last window ending at the sequence end is added, which
+    overlaps the previous one. Sequences shorter than the window size are
+    reported as a whole. Frequencies of each window are updated from
+    the previous one by adding the entering k-mers and subtracting the leaving
+    ones. Window mode requires the numpy engine.
+
     Note: The output file may be large, especially for relatively big k's.
     One may consider piping the output to a downstream application.
+
+    Two counting engines are available: "numpy" (default) encodes each
+    sequence into 2-bit codes and tallies all k-mers with vectorized array
+    operations, whereas "python" walks through the sequence base by base. They
+    produce identical results, and the latter does not require NumPy.
 """
 
 import sys
 import argparse
 import unittest
+from collections import deque
+from functools import partial
+from multiprocessing import Pool
+
+from fasta_reader import read_fasta
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
 
 
 def parse_args():
@@ -32,14 +87,41 @@ def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter)
     arg = parser.add_argument
-    arg('-i', '--input', type=argparse.FileType('r'), default=sys.stdin,
-        help='input DNA sequences (multi-FASTA), default: stdin')
-    arg('-k', '--kvalue', type=int, default=4,
-        help='k-mer size, default: 4')
+    arg('-i', '--input', type=argparse.FileType('rb'), default=sys.stdin,
+        help=('input DNA sequences (multi-FASTA, may be gzipped), '
+              'default: stdin'))
+    arg('--mmap', action='store_true',
+        help='memory-map input file (if plain)')
+    arg('-k', '--kvalue', type=int, nargs='+', default=[4],
+        help='k-mer size(s), default: 4')
     arg('-l', '--minlen', type=int,
         help='minimum length threshold')
-    arg('-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
-        help='output k-mer frequency table, default: stdout')
+    arg('-s', '--sparse', type=int,
+        help=('count k-values above this threshold in sparse mode, '
+              'default: off'))
+    arg('-c', '--canonical', action='store_true',
+        help='report one column per reverse complement pair of k-mers')
+    arg('-w', '--window', type=int,
+        help=('report k-mer frequencies of sliding windows of this size (the '
+              'last window ends at the sequence end, and a sequence shorter '
+              'than this is reported as a whole)'))
+    arg('--step', type=int,
+        help='step size of sliding windows, default: window size')
+    arg('-e', '--engine', type=str, default='numpy',
+        choices=['numpy', 'python'],
+        help='k-mer counting engine, default: numpy')
+    arg('-t', '--threads', type=int, default=1,
+        help='number of processes, default: 1')
+    arg('-b', '--batch', type=int, default=1000000,
+        help=('total length of sequences per batch dispatched to each '
+              'process, default: 1000000'))
+    arg('-f', '--format', type=str, default='tsv',
+        choices=['tsv', 'bin', 'store'],
+        help='output format, default: tsv')
+    arg('-o', '--output', type=str,
+        help=('output k-mer frequency table, or output filepath stem if there '
+              'are multiple k-values, or feature store directory, default: '
+              'stdout'))
     for arg in parser._actions:
         arg.metavar = ''
     if len(sys.argv) == 1:
@@ -55,39 +137,306 @@ def main():
     # minimu length threshold
     minlen = args.minlen or 0
 
-    # output file
-    out = args.output
+    # k-mer sizes
+    ks = args.kvalue
+
+    # output files
+    binary = args.format in ('bin', 'store')
+    store = args.format == 'store'
+    if store:
+        if not args.output:
+            exit('Feature store directory is required.')
+        outs = [None] * len(ks)
+    elif len(ks) == 1:
+        if args.output:
+            outs = [open(args.output, 'wb' if binary else 'w')]
+        else:
+            outs = [sys.stdout.buffer if binary else sys.stdout]
+    elif args.output:
+        ext = 'kmat' if binary else 'tsv'
+        outs = [open(f'{args.output}.k{k}.{ext}', 'wb' if binary else 'w')
+                for k in ks]
+    else:
+        exit('Output filepath stem is required for multiple k-values.')
 
     # valid bases
     chars = 'ACGT'
 
-    # function to get base index (forward and reverse)
-    # tobit = chars.index
-    tobit = chars.find
+    # k-values to count in sparse mode
+    sparse = [args.sparse is not None and k > args.sparse for k in ks]
+    if any(sparse) and np is None:
+        exit('Sparse mode requires Python library NumPy.')
+    if any(sparse) and args.engine == 'python':
+        exit('Sparse mode is not supported by the python engine.')
+    if max(ks) > 31:
+        exit('k-values above 31 are not supported.')
+    if any(sparse) and store:
+        exit('Sparse mode does not support feature store output.')
 
-    # k-mer size
-    k = args.kvalue
+    # sliding windows
+    window = args.window
+    step = args.step or window
+    if window:
+        if args.engine == 'python' or np is None:
+            exit('Window mode requires the numpy engine.')
+        if any(sparse):
+            exit('Window mode does not support sparse mode.')
+        if window < 1 or step < 1:
+            exit('Window and step sizes must be positive.')
 
-    # total number of kmers
-    n = len(chars) ** k
+    # k-mers to report
+    idxs = [canonical_kmers(k, len(chars) ** k) if args.canonical and not s
+            else None for k, s in zip(ks, sparse)]
 
-    # print header (all possible k-mers)
-    head = list_kmers(chars, k, n)
-    print('', '\t'.join(head), sep='\t', file=out)
+    # check counting engine
+    if (args.engine == 'numpy' or binary) and np is None:
+        exit('The numpy engine and binary format require Python library '
+             'NumPy.')
+
+    # print header (all possible or canonical k-mers)
+    heads = []
+    for k, s, idx, out in zip(ks, sparse, idxs, outs):
+        if s:
+            head = None
+        else:
+            head = list_kmers(chars, k, len(chars) ** k)
+            if idx is not None:
+                head = [head[i] for i in idx]
+        heads.append(head)
+        if binary:
+            continue
+        if s:
+            print('ID', 'kmer', 'count', sep='\t', file=out)
+        else:
+            print('', '\t'.join(head), sep='\t', file=out)
+    files = [] if store else outs
+    if store:
+        from feature_store import GroupWriter
+        outs = [GroupWriter(args.output, f'kmers.k{k}', head)
+                for k, head in zip(ks, heads)]
+    elif binary:
+        from kmer_matrix import MatrixWriter, SparseMatrixWriter
+        outs = [SparseMatrixWriter(out, k) if s else MatrixWriter(out, head)
+                for out, k, s, head in zip(outs, ks, sparse, heads)]
 
     # extract k-mer frequencies
-    name, seq, freqs = '', '', None
-    for line in args.input:
-        if line[0] == '>':
-            if seq and len(seq) >= minlen:
-                freqs = count_kmers(seq, k, n, tobit)
-                print(name, '\t'.join(map(str, freqs)), sep='\t', file=out)
-            name, seq = line[1:].rstrip().split()[0], ''
+    func = partial(count_batch, ks=ks, idxs=idxs, engine=args.engine,
+                   binary=binary, sparse=sparse, canonical=args.canonical,
+                   window=window, step=step)
+    batches = batch_seqs(read_seqs(args.input, minlen, args.mmap), args.batch)
+    if args.threads > 1:
+        res = imap_ordered(func, batches, args.threads)
+    else:
+        res = map(func, batches)
+    for rows in res:
+        for block, out in zip(rows, outs):
+            if binary:
+                out.write(*block)
+            else:
+                out.write(block)
+
+    if binary:
+        for out in outs:
+            out.close()
+    for f in files:
+        if f is not sys.stdout and f is not sys.stdout.buffer:
+            f.close()
+
+
+def read_seqs(f, minlen=0, use_mmap=False):
+    """Read sequences from a multi-FASTA file.
+
+    Parameters
+    ----------
+    f : file handle
+        Input multi-FASTA file.
+    minlen : int, optional
+        Minimum length threshold.
+    use_mmap : bool, optional
+        Memory-map input file.
+
+    Yields
+    ------
+    tuple of (str, bytes)
+        Sequence identifier and sequence.
+    """
+    for title, seq in read_fasta(f, use_mmap):
+        if seq and len(seq) >= minlen:
+            yield title.split()[0], seq
+
+
+def batch_seqs(seqs, size):
+    """Group sequences into batches of a given total length.
+
+    Parameters
+    ----------
+    seqs : iterable of (str, str)
+        Sequence identifiers and sequences.
+    size : int
+        Minimum total length of sequences per batch.
+
+    Yields
+    ------
+    list of (str, str)
+        Batch of sequence identifiers and sequences.
+    """
+    batch, total = [], 0
+    for name, seq in seqs:
+        batch.append((name, seq))
+        total += len(seq)
+        if total >= size:
+            yield batch
+            batch, total = [], 0
+    if batch:
+        yield batch
+
+
+def imap_ordered(func, iterable, processes):
+    """Apply a function to items in a process pool and yield results in the
+    original order.
+
+    Parameters
+    ----------
+    func : callable
+        Function to apply.
+    iterable : iterable
+        Items to process.
+    processes : int
+        Number of processes.
+
+    Yields
+    ------
+    object
+        Result of each item.
+
+    Notes
+    -----
+    Unlike `Pool.imap`, which consumes the entire iterable in advance, this
+    function keeps at most two pending items per process, so that the input
+    is read only as fast as it is processed.
+    """
+    with Pool(processes) as pool:
+        pending = deque()
+        for item in iterable:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def count_batch(batch, ks, idxs=None, engine='numpy', binary=False,
+                sparse=None, canonical=False, window=None, step=None):
+    """Count k-mers of a batch of sequences and format output rows.
+
+    Parameters
+    ----------
+    batch : list of (str, str)
+        Sequence identifiers and sequences.
+    ks : list of int
+        k-mer sizes.
+    idxs : list of list of int, optional
+        Indices of k-mers to report per k-mer size (None for all).
+    engine : {'numpy', 'python'}, optional
+        k-mer counting engine.
+    binary : bool, optional
+        Return arrays instead of text rows.
+    sparse : list of bool, optional
+        Whether to count each k-mer size in sparse mode.
+    canonical : bool, optional
+        Report canonical k-mers only in sparse mode.
+    window : int, optional
+        Count k-mers in sliding windows of this size.
+    step : int, optional
+        Step size of sliding windows.
+
+    Returns
+    -------
+    list of str, or list of tuple
+        Output rows per k-mer size: text rows, or identifiers and frequencies
+        (dense), or identifiers, numbers of k-mers, codes and frequencies
+        (sparse).
+    """
+    chars = 'ACGT'
+    idxs = idxs or [None] * len(ks)
+    sparse = sparse or [False] * len(ks)
+    if engine == 'numpy':
+        table = encode_table(chars)
+
+        def finalize(k, s, idx, x):
+            if s:
+                if canonical:
+                    keep = x[0] <= revcomp_codes(x[0], k)
+                    x = x[0][keep], x[1][keep]
+            else:
+                if idx is not None:
+                    x = x[idx]
+                if not binary:
+                    x = x.tolist()
+            return x
+
+        def counter(seq):
+            if window:
+                spans, res = count_windows_np(seq, ks, table, window, step)
+            else:
+                spans, res = None, [[x] for x in count_kmers_multi_np(
+                    seq, ks, table, sparse)]
+            return spans, [[finalize(k, s, idx, x) for x in rows]
+                           for k, s, idx, rows in zip(ks, sparse, idxs, res)]
+    else:
+
+        # function to get base index (forward and reverse)
+        # tobit = chars.index
+        tobit = chars.find
+
+        def counter(seq):
+            if isinstance(seq, bytes):
+                seq = seq.decode()
+            seq = seq.upper()
+            res = [count_kmers(seq, k, len(chars) ** k, tobit) for k in ks]
+            return None, [[x if idx is None else [x[i] for i in idx]]
+                          for x, idx in zip(res, idxs)]
+
+    names = []
+    res = [[] for _ in ks]
+    for name, seq in batch:
+        spans, freqs = counter(seq)
+        if spans is None:
+            names.append(name)
         else:
-            seq += line.rstrip().upper()
-    if seq and len(seq) >= minlen:
-        freqs = count_kmers(seq, k, n, tobit)
-        print(name, '\t'.join(map(str, freqs)), sep='\t', file=out)
+            names.extend(f'{name}:{start + 1}-{end}' for start, end in spans)
+        for rows, x in zip(res, freqs):
+            rows.extend(x)
+
+    blocks = []
+    for k, s, rows in zip(ks, sparse, res):
+
+        # sparse binary: codes and counts of all rows
+        if s and binary:
+            sizes = [len(x[0]) for x in rows]
+            codes = np.concatenate([x[0] for x in rows])
+            counts = np.concatenate([x[1] for x in rows])
+            blocks.append((names, sizes, codes, counts))
+
+        # sparse text: one line per sequence and k-mer
+        elif s:
+            lines = []
+            for name, (codes, counts) in zip(names, rows):
+                for kmer, count in zip(decode_kmers(codes, k, chars),
+                                       counts.tolist()):
+                    lines.append(f'{name}\t{kmer}\t{count}\n')
+            blocks.append(''.join(lines))
+
+        # dense binary: frequency matrix
+        elif binary:
+            blocks.append((names, np.array(rows, dtype='<u4')))
+
+        # dense text: one line per sequence
+        else:
+            blocks.append(''.join(
+                name + '\t' + '\t'.join(map(str, freqs)) + '\n'
+                for name, freqs in zip(names, rows)))
+    return blocks
 
 
 def list_kmers(chars, k, n):
@@ -117,6 +466,32 @@ def list_kmers(chars, k, n):
     return res
 
 
+def canonical_kmers(k, n):
+    """List indices of canonical k-mers.
+
+    Parameters
+    ----------
+    k : int
+        k-mer size.
+    n : int
+        Total number of k-mers.
+
+    Returns
+    -------
+    list of int
+        Indices of k-mers that are not greater than their reverse complements.
+    """
+    res = []
+    for i in range(n):
+        idx, rev = i, 0
+        for _ in range(k):
+            rev = (rev << 2) + 3 - (idx & 3)
+            idx >>= 2
+        if i <= rev:
+            res.append(i)
+    return res
+
+
 def count_kmers(seq, k, n, tobit):
     """Count k-mers.
 
@@ -179,6 +554,276 @@ def count_kmers(seq, k, n, tobit):
     return res
 
 
+def encode_table(chars):
+    """Build a lookup table from byte values to 2-bit codes.
+
+    Parameters
+    ----------
+    chars : str
+        All valid characters.
+
+    Returns
+    -------
+    np.array
+        Code of each byte value (0-255). Upper and lower cases of valid
+        characters are coded by their indices, and all other bytes by 4.
+    """
+    res = np.full(256, 4, dtype=np.uint8)
+    for i, c in enumerate(chars):
+        res[ord(c.upper())] = i
+        res[ord(c.lower())] = i
+    return res
+
+
+def count_kmers_np(seq, k, n, table):
+    """Count k-mers using vectorized operations.
+
+    Parameters
+    ----------
+    seq : str or bytes
+        DNA sequence.
+    k : int
+        k-mer size.
+    n : int
+        Total number of k-mers.
+    table : np.array
+        Lookup table from byte values to 2-bit codes.
+
+    Returns
+    -------
+    np.array
+        k-mer frequencies.
+    """
+    return count_kmers_multi_np(seq, [k], table)[0]
+
+
+def count_kmers_multi_np(seq, ks, table, sparse=None):
+    """Count k-mers of one or multiple sizes using vectorized operations.
+
+    Parameters
+    ----------
+    seq : str or bytes
+        DNA sequence.
+    ks : list of int
+        k-mer sizes.
+    table : np.array
+        Lookup table from byte values to 2-bit codes.
+    sparse : list of bool, optional
+        Whether to count each k-mer size in sparse mode.
+
+    Returns
+    -------
+    list of np.array, or list of (np.array, np.array)
+        k-mer frequencies per k-mer size, or sorted codes and frequencies of
+        observed k-mers (sparse mode).
+
+    Notes
+    -----
+    Valid k-mer codes are tallied by a single `bincount` (or `unique` in
+    sparse mode, which only allocates memory for observed k-mers).
+    """
+    sparse = dict(zip(ks, sparse or [False] * len(ks)))
+    res = {}
+    for k, fwd, rev, valid in kmer_codes_np(seq, ks, table):
+        codes = np.concatenate((fwd[valid], rev[valid]))
+        if sparse[k]:
+            res[k] = np.unique(codes, return_counts=True)
+        else:
+            res[k] = np.bincount(codes, minlength=4 ** k)
+    return [res[k] for k in ks]
+
+
+def count_windows_np(seq, ks, table, window, step):
+    """Count k-mers in sliding windows using rolling updates.
+
+    Parameters
+    ----------
+    seq : str or bytes
+        DNA sequence.
+    ks : list of int
+        k-mer sizes.
+    table : np.array
+        Lookup table from byte values to 2-bit codes.
+    window : int
+        Window size.
+    step : int
+        Step size.
+
+    Returns
+    -------
+    list of (int, int)
+        Start (0-based) and end positions of windows.
+    list of list of np.array
+        k-mer frequencies per k-mer size per window.
+
+    Notes
+    -----
+    Windows start at multiples of step. If the last one does not reach the
+    end of the sequence, a window ending at the sequence end is added, such
+    that the tail is covered. A sequence shorter than the window size is
+    reported as one window.
+
+    A window covers the k-mers starting within its first (window - k + 1)
+    positions. When consecutive windows overlap, frequencies of the next
+    window are updated from the current one by subtracting the k-mers that
+    leave and adding the k-mers that enter, instead of recounting the window.
+    """
+    L = len(seq)
+    if L <= window:
+        spans = [(0, L)]
+    else:
+        spans = [(x, x + window) for x in range(0, L - window + 1, step)]
+        if spans[-1][1] < L:
+            spans.append((L - window, L))
+    res = {}
+    for k, fwd, rev, valid in kmer_codes_np(seq, ks, table):
+        n = 4 ** k
+        m = spans[0][1] - k + 1
+
+        # no complete k-mer in window
+        if m <= 0:
+            res[k] = [np.zeros(n, dtype=np.int64) for _ in spans]
+            continue
+
+        def codes(start, end):
+            v = valid[start:end]
+            return np.concatenate((fwd[start:end][v], rev[start:end][v]))
+
+        rows, counts, last = [], None, None
+        for start, _ in spans:
+            if counts is None or start - last >= m:
+                counts = np.bincount(codes(start, start + m), minlength=n)
+            else:
+                np.subtract.at(counts, codes(last, start), 1)
+                np.add.at(counts, codes(last + m, start + m), 1)
+            rows.append(counts.copy())
+            last = start
+        res[k] = rows
+    return spans, [res[k] for k in ks]
+
+
+def kmer_codes_np(seq, ks, table):
+    """Generate forward and reverse complement k-mer codes of a sequence.
+
+    Parameters
+    ----------
+    seq : str or bytes
+        DNA sequence.
+    ks : list of int
+        k-mer sizes.
+    table : np.array
+        Lookup table from byte values to 2-bit codes.
+
+    Yields
+    ------
+    int
+        k-mer size (in ascending order).
+    np.array
+        Forward k-mer codes at each start position.
+    np.array
+        Reverse complement k-mer codes at each start position.
+    np.array of bool
+        Whether each k-mer is free of non-ACGT characters.
+
+    Notes
+    -----
+    The sequence is encoded into 2-bit codes in one go, then forward and
+    reverse complement codes of all windows are built by shifting the code
+    array.
+
+    Codes of (k + 1)-mers are extended from codes of k-mers starting at the
+    same positions, therefore all k-mer sizes are generated in a single pass
+    up to the largest one. The yielded arrays are modified in place during the
+    next iteration, therefore they should be consumed (or copied) right away.
+    """
+    if isinstance(seq, str):
+        seq = seq.encode()
+    bits = table[np.frombuffer(seq, dtype=np.uint8)]
+    L = len(bits)
+
+    # cumulative number of invalid characters
+    bad = np.zeros(L + 1, dtype=np.int64)
+    np.cumsum(bits > 3, out=bad[1:])
+
+    # forward & reverse indices of windows of growing size
+    bits = (bits & 3).astype(np.int64)
+    fwd = np.zeros(L, dtype=np.int64)
+    rev = np.zeros(L, dtype=np.int64)
+
+    kset = set(ks)
+    for i in range(max(ks)):
+        k = i + 1
+
+        # sequence shorter than k
+        if k > L:
+            if k in kset:
+                empty = np.zeros(0, dtype=np.int64)
+                yield k, empty, empty, np.zeros(0, dtype=bool)
+            continue
+
+        # add one character to the end of each window
+        m = L - i
+        fwd, rev = fwd[:m], rev[:m]
+        bit = bits[i:L]
+        fwd <<= 2
+        fwd |= bit
+        rev |= (3 - bit) << 2 * i
+
+        # windows without invalid characters
+        if k in kset:
+            yield k, fwd, rev, bad[k:] == bad[:-k]
+
+
+def revcomp_codes(codes, k):
+    """Calculate reverse complement codes of k-mers.
+
+    Parameters
+    ----------
+    codes : np.array
+        k-mer codes.
+    k : int
+        k-mer size.
+
+    Returns
+    -------
+    np.array
+        Reverse complement k-mer codes.
+    """
+    res = np.zeros_like(codes)
+    codes = codes.copy()
+    for _ in range(k):
+        res <<= 2
+        res |= 3 - (codes & 3)
+        codes >>= 2
+    return res
+
+
+def decode_kmers(codes, k, chars):
+    """Convert k-mer codes into k-mers.
+
+    Parameters
+    ----------
+    codes : np.array
+        k-mer codes.
+    k : int
+        k-mer size.
+    chars : str
+        All valid characters.
+
+    Returns
+    -------
+    list of str
+        k-mers.
+    """
+    lut = np.frombuffer(chars.encode(), dtype=np.uint8)
+    res = np.empty((len(codes), k), dtype=np.uint8)
+    codes = codes.copy()
+    for i in range(k - 1, -1, -1):
+        res[:, i] = lut[codes & 3]
+        codes >>= 2
+    return res.view(f'S{k}').ravel().astype(str).tolist()
+
+
 class Tests(unittest.TestCase):
     def setUp(self):
         self.chars = 'ACGT'
@@ -193,6 +838,111 @@ class Tests(unittest.TestCase):
                'TA', 'TC', 'TG', 'TT']
         self.assertListEqual(obs, exp)
 
+    def test_canonical_kmers(self):
+        k = 2
+        n = len(self.chars) ** k
+        obs = canonical_kmers(k, n)
+        head = list_kmers(self.chars, k, n)
+        obs = [head[i] for i in obs]
+        exp = ['AA', 'AC', 'AG', 'AT', 'CA', 'CC', 'CG', 'GA', 'GC', 'TA']
+        self.assertListEqual(obs, exp)
+
+        # number of canonical k-mers, including palindromes
+        for k in range(1, 7):
+            n = len(self.chars) ** k
+            p = len(self.chars) ** (k // 2) if k % 2 == 0 else 0
+            exp = (n + p) // 2
+            self.assertEqual(len(canonical_kmers(k, n)), exp)
+
+    def test_batch_seqs(self):
+        seqs = [('a', 'ACGT'), ('b', 'AC'), ('c', 'ACGTAC'), ('d', 'A')]
+        obs = [[x[0] for x in batch] for batch in batch_seqs(seqs, 5)]
+        self.assertListEqual(obs, [['a', 'b'], ['c'], ['d']])
+
+    def test_count_batch(self):
+        batch = [('a', 'ACGT'), ('b', 'GCACTA')]
+        obs = count_batch(batch, [2], engine='python')
+        exp = ['a\t0\t2\t0\t0\t0\t0\t2\t0\t0\t0\t0\t2\t0\t0\t0\t0\n'
+               'b\t0\t1\t1\t0\t1\t0\t0\t1\t0\t2\t0\t1\t2\t0\t1\t0\n']
+        self.assertListEqual(obs, exp)
+        if np is not None:
+            self.assertListEqual(count_batch(batch, [2]), exp)
+
+            # binary: a frequency matrix ready for the matrix writer
+            (names, obs), = count_batch(batch, [2], binary=True)
+            self.assertListEqual(names, ['a', 'b'])
+            self.assertIsInstance(obs, np.ndarray)
+            self.assertEqual(obs.dtype, np.dtype('<u4'))
+            self.assertListEqual(obs.tolist(), [
+                [int(x) for x in row.split('\t')[1:]]
+                for row in exp[0].splitlines()])
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_count_kmers_sparse(self):
+        table = encode_table(self.chars)
+        tobit = self.chars.find
+        seq = 'CCAGCTGCGTAACCGAGAAACTACGTCTNNACGTRACGGTTACAGNA'
+        ks = [3, 5]
+        obs = count_kmers_multi_np(seq, ks, table, [True, False])
+        codes, counts = obs[0]
+        exp = count_kmers(seq, 3, 64, tobit)
+        self.assertListEqual(codes.tolist(), [
+            i for i, x in enumerate(exp) if x])
+        self.assertListEqual(counts.tolist(), [x for x in exp if x])
+        self.assertListEqual(obs[1].tolist(), count_kmers(
+            seq, 5, 1024, tobit))
+
+        # large k: 9 windows in the first 28 bases, both strands
+        codes, counts = count_kmers_multi_np(seq, [20], table, [True])[0]
+        self.assertEqual(codes.size, 18)
+        self.assertListEqual(counts.tolist(), [1] * 18)
+        rc = seq.translate(str.maketrans('ACGT', 'TGCA'))[::-1]
+        for kmer in decode_kmers(codes, 20, self.chars):
+            self.assertTrue(kmer in seq or kmer in rc)
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_count_windows_np(self):
+        table = encode_table(self.chars)
+        tobit = self.chars.find
+        seq = 'CCAGCTGCGTAACCGAGAAACTACGTCTNNACGTRACGGTTACAGNA'
+        for window, step in ((10, 3), (10, 10), (12, 15), (2, 1)):
+            spans, obs = count_windows_np(seq, [2, 3], table, window, step)
+            self.assertEqual(spans[0], (0, window))
+            self.assertEqual(spans[-1], (len(seq) - window, len(seq)))
+            for k, rows in zip([2, 3], obs):
+                n = len(self.chars) ** k
+                for (start, end), freqs in zip(spans, rows):
+                    exp = count_kmers(seq[start:end], k, n, tobit)
+                    self.assertListEqual(freqs.tolist(), exp)
+
+        # sequence shorter than window
+        spans, obs = count_windows_np('ACGTA', [2], table, 10, 5)
+        self.assertListEqual(spans, [(0, 5)])
+        exp = count_kmers('ACGTA', 2, 16, tobit)
+        self.assertListEqual(obs[0][0].tolist(), exp)
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_revcomp_codes(self):
+        k = 3
+        n = len(self.chars) ** k
+        head = list_kmers(self.chars, k, n)
+        obs = revcomp_codes(np.arange(n), k)
+        comp = str.maketrans('ACGT', 'TGCA')
+        exp = [head.index(x.translate(comp)[::-1]) for x in head]
+        self.assertListEqual(obs.tolist(), exp)
+
+        # canonical k-mers
+        idx = np.arange(n)
+        obs = idx[idx <= obs].tolist()
+        self.assertListEqual(obs, canonical_kmers(k, n))
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_decode_kmers(self):
+        k = 3
+        n = len(self.chars) ** k
+        obs = decode_kmers(np.arange(n), k, self.chars)
+        self.assertListEqual(obs, list_kmers(self.chars, k, n))
+
     def test_count_kmers(self):
         tobit = self.chars.index
 
@@ -221,6 +971,62 @@ class Tests(unittest.TestCase):
                1, 2, 1, 0, 0, 0, 1, 2, 0, 1, 1, 0, 1, 1, 0, 1]
         self.assertListEqual(obs, exp)
 
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_count_kmers_np(self):
+        table = encode_table(self.chars)
+
+        k = 2
+        n = len(self.chars) ** k
+        obs = count_kmers_np('ACGT', k, n, table).tolist()
+        exp = [0, 2, 0, 0,
+               0, 0, 2, 0,
+               0, 0, 0, 2,
+               0, 0, 0, 0]
+        self.assertListEqual(obs, exp)
+
+        obs = count_kmers_np('GCACTA', k, n, table).tolist()
+        exp = [0, 1, 1, 0,
+               1, 0, 0, 1,
+               0, 2, 0, 1,
+               2, 0, 1, 0]
+        self.assertListEqual(obs, exp)
+
+        # sequence shorter than k
+        obs = count_kmers_np('A', k, n, table).tolist()
+        self.assertListEqual(obs, [0] * n)
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_count_kmers_engines(self):
+        table = encode_table(self.chars)
+        tobit = self.chars.find
+        seq = 'CCAGCTGCGTAACCGAGAAACTACGTCTNNACGTRACGGTTACAGNA'
+        for k in range(1, 7):
+            n = len(self.chars) ** k
+            exp = count_kmers(seq, k, n, tobit)
+            obs = count_kmers_np(seq, k, n, table).tolist()
+            self.assertListEqual(obs, exp)
+
+            # lower case
+            obs = count_kmers_np(seq.lower(), k, n, table).tolist()
+            self.assertListEqual(obs, exp)
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_count_kmers_multi_np(self):
+        table = encode_table(self.chars)
+        tobit = self.chars.find
+        seq = 'CCAGCTGCGTAACCGAGAAACTACGTCTNNACGTRACGGTTACAGNA'
+        ks = [4, 2, 6, 3]
+        obs = count_kmers_multi_np(seq, ks, table)
+        for k, freqs in zip(ks, obs):
+            exp = count_kmers(seq, k, len(self.chars) ** k, tobit)
+            self.assertListEqual(freqs.tolist(), exp)
+
+        # sequence shorter than some k's
+        obs = count_kmers_multi_np('ACGTA', [4, 6], table)
+        exp = count_kmers('ACGTA', 4, 256, tobit)
+        self.assertListEqual(obs[0].tolist(), exp)
+        self.assertListEqual(obs[1].tolist(), [0] * 4096)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+"""Fast streaming reader of multi-FASTA files.
+
+Usage:
+    from fasta_reader import read_fasta
+    with open('input.fna', 'rb') as f:
+        for title, seq in read_fasta(f):
+            ...
+
+Notes:
+    Sequences are read as bytes, and the lines of each sequence are joined
+    only once, when the record is complete, instead of concatenating strings
+    line by line, which is quadratic on long sequences.
+
+    Gzip-compressed input is detected and decompressed automatically. Plain
+    files may optionally be memory-mapped, in which case records are sliced
+    directly out of the mapped file.
+
+    Titles are returned in full (without ">" and trailing whitespaces), such
+    that each tool may extract sequence identifiers in its own way. Sequences
+    are returned as is (case is preserved), with all whitespaces removed.
+
+    Alternatively, sequences may be read line by line, such that a tool can
+    accumulate statistics of long sequences without holding them in memory.
+
+    A plain file may be indexed in the samtools faidx format (name, length,
+    offset, bases per line, bytes per line), and the index is cached beside
+    the file (".fai"). Sequences are then copied byte by byte from the file
+    (e.g., into bin files) without being parsed or held in memory. Files with
+    irregular line wrapping (lines of different lengths within a sequence)
+    cannot be indexed this way.
+"""
+
+import io
+import os
+import gzip
+import mmap
+import unittest
+
+
+# whitespaces to be removed from sequences
+WHITESPACE = b' \t\r\n\v\f'
+
+
+def read_fasta(f, use_mmap=False):
+    """Read sequences from a multi-FASTA file.
+
+    Parameters
+    ----------
+    f : file handle
+        Input multi-FASTA file, opened in binary mode (or a text handle with
+        an underlying binary buffer, such as `sys.stdin`).
+    use_mmap : bool, optional
+        Memory-map the file if it is a plain (uncompressed) regular file.
+
+    Yields
+    ------
+    tuple of (str, bytes)
+        Sequence title and sequence.
+    """
+    f = getattr(f, 'buffer', f)
+    if is_gzip(f):
+        with gzip.GzipFile(fileobj=f) as fz:
+            yield from _read_lines(io.BufferedReader(fz))
+        return
+    if use_mmap:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            mm = None
+        if mm is not None:
+            with mm:
+                yield from _read_mmap(mm)
+            return
+    yield from _read_lines(f)
+
+
+def read_fasta_lines(f):
+    """Read titles and sequence lines from a multi-FASTA file.
+
+    Parameters
+    ----------
+    f : file handle
+        Input multi-FASTA file, opened in binary mode (or a text handle with
+        an underlying binary buffer, such as `sys.stdin`).
+
+    Yields
+    ------
+    tuple of (str, None) or (None, bytes)
+        Sequence title, or sequence line (with whitespaces removed).
+    """
+    f = getattr(f, 'buffer', f)
+    if is_gzip(f):
+        f = io.BufferedReader(gzip.GzipFile(fileobj=f))
+    started = False
+    for line in f:
+        if line[:1] == b'>':
+            started = True
+            yield line[1:].rstrip().decode(), None
+        elif started:
+            yield None, line.translate(None, WHITESPACE)
+
+
+def index_fasta(f):
+    """Index sequences of a plain multi-FASTA file.
+
+    Parameters
+    ----------
+    f : file handle
+        Input multi-FASTA file, opened in binary mode.
+
+    Returns
+    -------
+    dict of str: tuple of (int, int, int, int), or None
+        Length, offset of first base, bases per line and bytes per line of
+        each sequence (by title up to the first whitespace), or None if the
+        line wrapping is irregular.
+
+    Notes
+    -----
+    If a name appears multiple times, the last sequence is indexed.
+    """
+    index = {}
+    rec, ended = None, False
+    offset = 0
+    for line in f:
+        size = len(line)
+        if line[:1] == b'>':
+            name = (line[1:].decode().split(None, 1) or [''])[0]
+            rec, ended = [0, offset + size, 0, 0], False
+            index[name] = rec
+        elif rec is not None:
+            bases = len(line.rstrip(b'\r\n'))
+
+            # a short or blank line must be the last one of a sequence
+            if ended and bases:
+                return None
+            if not bases:
+                ended = True
+            elif not rec[2]:
+                rec[2:] = bases, size
+            elif bases > rec[2] or (bases == rec[2] and size != rec[3]
+                                    and line[-1:] == b'\n'):
+                return None
+            if bases < rec[2]:
+                ended = True
+            rec[0] += bases
+        offset += size
+    return {k: tuple(v) for k, v in index.items()}
+
+
+def load_index(fp):
+    """Load the index of a multi-FASTA file, building it if needed.
+
+    Parameters
+    ----------
+    fp : str
+        Input multi-FASTA file.
+
+    Returns
+    -------
+    dict of str: tuple of (int, int, int, int), or None
+        Index (see `index_fasta`), or None if the file is compressed or its
+        line wrapping is irregular.
+
+    Notes
+    -----
+    An index file (fp + ".fai") is reused if it is not older than the FASTA
+    file. Otherwise the index is built and saved (if possible).
+    """
+    fai = fp + '.fai'
+    if os.path.isfile(fai) and os.path.getmtime(fai) >= os.path.getmtime(fp):
+        index = {}
+        with open(fai) as f:
+            for line in f:
+                row = line.rstrip('\r\n').split('\t')
+                index[row[0]] = tuple(int(x) for x in row[1:5])
+        return index
+    with open(fp, 'rb') as f:
+        if is_gzip(f):
+            return None
+        index = index_fasta(f)
+    if index is None:
+        return None
+    try:
+        with open(fai + '.tmp', 'w') as f:
+            for name, rec in index.items():
+                print(name, *rec, sep='\t', file=f)
+        os.replace(fai + '.tmp', fai)
+    except OSError:
+        pass
+    return index
+
+
+def copy_sequence(src, dst, rec):
+    """Copy the bytes of a sequence from an indexed file to another file.
+
+    Parameters
+    ----------
+    src : file handle
+        Input multi-FASTA file, opened in binary mode.
+    dst : file handle
+        Output file, opened in binary mode.
+    rec : tuple of (int, int, int, int)
+        Index of sequence (see `index_fasta`).
+
+    Notes
+    -----
+    The sequence is copied with its original line wrapping, followed by a
+    line break. It is copied within the kernel (`os.sendfile`) if possible.
+    Windows line breaks (CRLF) are converted into LF, such that the output
+    has consistent line breaks.
+    """
+    length, offset, bases, width = rec
+    if not length:
+        return
+    full = (length - 1) // bases
+    count = full * width + length - full * bases
+
+    # CRLF: read whole lines and convert line breaks
+    if width != bases + 1:
+        src.seek(offset)
+        size = max(1, (1 << 20) // width) * width
+        while count:
+            buf = src.read(min(count, size))
+            if not buf:
+                break
+            dst.write(buf.replace(b'\r\n', b'\n'))
+            count -= len(buf)
+        dst.write(b'\n')
+        return
+
+    dst.flush()
+    try:
+        while count:
+            sent = os.sendfile(dst.fileno(), src.fileno(), offset, count)
+            if not sent:
+                break
+            offset += sent
+            count -= sent
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        src.seek(offset)
+        while count:
+            buf = src.read(min(count, 1 << 20))
+            if not buf:
+                break
+            dst.write(buf)
+            count -= len(buf)
+    else:
+        dst.seek(0, 2)
+    dst.write(b'\n')
+
+
+def is_gzip(f):
+    """Check whether a binary file handle is gzip-compressed.
+
+    Parameters
+    ----------
+    f : file handle
+        Binary file handle.
+
+    Returns
+    -------
+    bool
+        Whether the next two bytes are the gzip magic number.
+
+    Notes
+    -----
+    The file position is not changed.
+    """
+    if hasattr(f, 'peek'):
+        return f.peek(2)[:2] == b'\x1f\x8b'
+    if f.seekable():
+        pos = f.tell()
+        res = f.read(2) == b'\x1f\x8b'
+        f.seek(pos)
+        return res
+    return False
+
+
+def _read_lines(f):
+    """Read sequences line by line.
+    """
+    title, lines = None, []
+    for line in f:
+        if line[:1] == b'>':
+            if title is not None:
+                yield title, b''.join(lines).translate(None, WHITESPACE)
+            title, lines = line[1:].rstrip().decode(), []
+        else:
+            lines.append(line)
+    if title is not None:
+        yield title, b''.join(lines).translate(None, WHITESPACE)
+
+
+def _read_mmap(mm):
+    """Read sequences from a memory-mapped file.
+    """
+    size = len(mm)
+    pos = 0 if mm[:1] == b'>' else mm.find(b'\n>') + 1
+    if pos == 0 and mm[:1] != b'>':
+        return
+    while pos < size:
+        eol = mm.find(b'\n', pos)
+        if eol == -1:
+            eol = size
+        end = mm.find(b'\n>', eol)
+        end = size if end == -1 else end + 1
+        title = mm[pos + 1:eol].rstrip().decode()
+        yield title, mm[eol + 1:end].translate(None, WHITESPACE)
+        pos = end
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.text = (b'>seq1 first sequence\n'
+                     b'ACGTACGT\n'
+                     b'acgtNN\r\n'
+                     b'>seq2\n'
+                     b'>seq3\tthird\n'
+                     b'GGCC\n'
+                     b'TT')
+        self.exp = [('seq1 first sequence', b'ACGTACGTacgtNN'),
+                    ('seq2', b''),
+                    ('seq3\tthird', b'GGCCTT')]
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    def test_read_fasta(self):
+        obs = list(read_fasta(io.BytesIO(self.text)))
+        self.assertListEqual(obs, self.exp)
+
+    def test_read_fasta_lines(self):
+        obs = list(read_fasta_lines(io.BytesIO(self.text)))
+        exp = [('seq1 first sequence', None), (None, b'ACGTACGT'),
+               (None, b'acgtNN'), ('seq2', None), ('seq3\tthird', None),
+               (None, b'GGCC'), (None, b'TT')]
+        self.assertListEqual(obs, exp)
+
+    def test_read_fasta_gzip(self):
+        fp = os.path.join(self.tmpdir, 'test.fa.gz')
+        with gzip.open(fp, 'wb') as f:
+            f.write(self.text)
+        with open(fp, 'rb') as f:
+            obs = list(read_fasta(f, use_mmap=True))
+        self.assertListEqual(obs, self.exp)
+
+    def test_read_fasta_mmap(self):
+        fp = os.path.join(self.tmpdir, 'test.fa')
+        with open(fp, 'wb') as f:
+            f.write(self.text)
+        with open(fp, 'rb') as f:
+            obs = list(read_fasta(f, use_mmap=True))
+        self.assertListEqual(obs, self.exp)
+
+        # trailing newline
+        with open(fp, 'wb') as f:
+            f.write(self.text + b'\n')
+        with open(fp, 'rb') as f:
+            obs = list(read_fasta(f, use_mmap=True))
+        self.assertListEqual(obs, self.exp)
+
+        # empty file
+        open(fp, 'wb').close()
+        with open(fp, 'rb') as f:
+            obs = list(read_fasta(f, use_mmap=True))
+        self.assertListEqual(obs, [])
+
+    def test_index(self):
+        fp = os.path.join(self.tmpdir, 'test.fa')
+        text = (b'>seq1\tfirst\nACGT\nACGT\nAC\n>seq2\n>seq3\r\nGGCC\r\nTT\r\n'
+                b'>seq4\nACGT\nACGT')
+        with open(fp, 'wb') as f:
+            f.write(text)
+        obs = load_index(fp)
+        exp = {'seq1': (10, 12, 4, 5), 'seq2': (0, 31, 0, 0),
+               'seq3': (6, 38, 4, 6), 'seq4': (8, 54, 4, 5)}
+        self.assertDictEqual(obs, exp)
+        self.assertTrue(os.path.isfile(fp + '.fai'))
+        self.assertDictEqual(load_index(fp), exp)
+
+        out = os.path.join(self.tmpdir, 'out.fa')
+        with open(fp, 'rb') as src, open(out, 'wb') as dst:
+            for name in ('seq3', 'seq1', 'seq4'):
+                dst.write(f'>{name}\n'.encode())
+                copy_sequence(src, dst, obs[name])
+        with open(out, 'rb') as f:
+            self.assertEqual(f.read(), (
+                b'>seq3\nGGCC\nTT\n>seq1\nACGT\nACGT\nAC\n'
+                b'>seq4\nACGT\nACGT\n'))
+
+        # irregular line wrapping
+        for text in (b'>seq1\nACG\nACGT\n', b'>seq1\nACGT\nAC\nAC\n',
+                     b'>seq1\nACGT\n\nACGT\n'):
+            self.assertIsNone(index_fasta(io.BytesIO(text)))
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+"""Store contig features in a columnar format, and export them for binarena.
+
+Usage:
+    python me.py -s sample.features -l
+    python me.py -s sample.features -o binarena.tsv
+    python me.py -s sample.features -c length GC 4UM1 4UM2 -o subset.tsv
+
+Store:
+    A directory per assembly, containing one Parquet file per named column
+    group (e.g., basic.parquet, kmers.k4.parquet, umap4.parquet, taxa.parquet),
+    each with a first column "ID" (contig identifiers) followed by features.
+
+Notes:
+    Tools append column groups to a store as they are run:
+        sequence_basics.py --store: basic (length, GC, coverage)
+        count_kmers.py -f store: kmers.k4, kmers.k5, etc.
+        reduce_dimension.py --store: pca4, tsne4, umap4, etc.
+        binstager.py --store: taxa (depth, taxa)
+
+    Adding a group only writes that group's file, and rewriting a group
+    replaces its file. Groups are written to a temporary file first, such
+    that readers never see a partial group.
+
+    Reading loads only the requested columns of the requested groups from
+    disk. Groups are aligned by contig identifier in one concatenation, with
+    rows in the order of the first group (basic if present). A column that
+    appears in multiple groups is taken from the first group.
+
+    The exported table is in the binarena input format, with "ID" as the first
+    column. By default, all groups except k-mer frequency tables (kmers.*) are
+    exported.
+
+    It requires the Python library pyarrow.
+"""
+
+import os
+import sys
+import argparse
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+# file extension of column groups
+EXT = '.parquet'
+
+
+def parse_args():
+    """Command-line interface.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg = parser.add_argument
+    arg('-s', '--store', type=str, required=True,
+        help='feature store directory')
+    arg('-l', '--list', action='store_true',
+        help='list column groups and their columns')
+    arg('-g', '--groups', type=str, nargs='+',
+        help='column groups to export, default: all but k-mer tables')
+    arg('-c', '--columns', type=str, nargs='+',
+        help='columns to export, default: all')
+    arg('-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
+        help='output table, default: stdout')
+    for arg in parser._actions:
+        arg.metavar = ''
+    if len(sys.argv) == 1:
+        print(__doc__)
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.path.isdir(args.store):
+        exit(f'Feature store {args.store} does not exist.')
+    if args.list:
+        for group, columns in list_groups(args.store).items():
+            print(group, ', '.join(columns), sep='\t', file=args.output)
+        return
+    try:
+        export_tsv(args.store, args.output, args.columns, args.groups)
+    except ValueError as e:
+        exit(str(e))
+
+
+def import_pyarrow():
+    """Import pyarrow, or exit with a message.
+
+    Returns
+    -------
+    module
+        pyarrow.
+    module
+        pyarrow.parquet.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ModuleNotFoundError:
+        exit('The feature store requires Python library pyarrow.')
+    return pa, pq
+
+
+class GroupWriter:
+    """Write a column group to a feature store row by row.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory (created if not existing).
+    group : str
+        Name of column group.
+    columns : list of str
+        Column labels.
+    dtype : str, optional
+        Data type of values.
+    """
+    def __init__(self, store, group, columns, dtype='<u4'):
+        pa, self.pq = import_pyarrow()
+        self.pa = pa
+        self.fp = group_path(store, group)
+        os.makedirs(store, exist_ok=True)
+        self.tmp = f'{self.fp}.tmp'
+        self.columns = [str(x) for x in columns]
+        self.dtype = np.dtype(dtype)
+        type_ = pa.from_numpy_dtype(self.dtype)
+        self.schema = pa.schema([('ID', pa.string())] + [
+            (x, type_) for x in self.columns])
+        self.writer = self.pq.ParquetWriter(self.tmp, self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, ids, data):
+        """Write rows.
+
+        Parameters
+        ----------
+        ids : list of str
+            Row identifiers.
+        data : array_like of shape (len(ids), len(columns))
+            Values of rows.
+        """
+        data = np.asarray(data, dtype=self.dtype).reshape(
+            len(ids), len(self.columns))
+        arrays = [self.pa.array([str(x) for x in ids], self.pa.string())]
+        arrays.extend(self.pa.array(data[:, i]) for i in range(
+            data.shape[1]))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            arrays, schema=self.schema))
+
+    def close(self):
+        """Close file and move it in place.
+        """
+        self.writer.close()
+        os.replace(self.tmp, self.fp)
+
+
+def group_path(store, group):
+    """Get file path of a column group.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory.
+    group : str
+        Name of column group.
+
+    Returns
+    -------
+    str
+        File path.
+    """
+    if not group or os.sep in group:
+        raise ValueError(f'Invalid column group name: {group}.')
+    return os.path.join(store, group + EXT)
+
+
+def write_group(store, group, df):
+    """Write a data frame as a column group.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory (created if not existing).
+    group : str
+        Name of column group.
+    df : pd.DataFrame
+        Features, indexed by contig identifier.
+    """
+    _, pq = import_pyarrow()
+    fp = group_path(store, group)
+    os.makedirs(store, exist_ok=True)
+    df = df.copy()
+    df.index = df.index.astype(str).rename('ID')
+    df.columns = [str(x) for x in df.columns]
+    df.reset_index().to_parquet(f'{fp}.tmp', index=False)
+    os.replace(f'{fp}.tmp', fp)
+
+
+def list_groups(store):
+    """List column groups of a feature store.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory.
+
+    Returns
+    -------
+    dict of str: list of str
+        Column labels (excluding "ID") per group, basic first, then in
+        alphabetical order.
+    """
+    _, pq = import_pyarrow()
+    groups = sorted(x[:-len(EXT)] for x in os.listdir(store) if x.endswith(
+        EXT))
+    if 'basic' in groups:
+        groups.remove('basic')
+        groups.insert(0, 'basic')
+    res = {}
+    for group in groups:
+        names = pq.read_schema(group_path(store, group)).names
+        res[group] = [x for x in names if x != 'ID']
+    return res
+
+
+def read_store(store, columns=None, groups=None):
+    """Read selected columns from a feature store.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory.
+    columns : list of str, optional
+        Columns to read. Default: all.
+    groups : list of str, optional
+        Column groups to read. Default: all.
+
+    Returns
+    -------
+    pd.DataFrame
+        Features, indexed by contig identifier.
+
+    Raises
+    ------
+    ValueError
+        If a group or column is not found.
+    """
+    _, pq = import_pyarrow()
+    available = list_groups(store)
+    if groups is None:
+        groups = list(available)
+    for group in groups:
+        if group not in available:
+            raise ValueError(f'Column group {group} is not found.')
+
+    # columns to read from each group (first occurrence wins)
+    seen, plan = set(), []
+    for group in groups:
+        cols = [x for x in available[group] if x not in seen and (
+            columns is None or x in columns)]
+        seen.update(cols)
+        if cols:
+            plan.append((group, cols))
+    if columns is not None:
+        missing = [x for x in columns if x not in seen]
+        if missing:
+            raise ValueError(f'Columns not found: {", ".join(missing)}.')
+
+    # read and align groups
+    frames = [pq.read_table(group_path(store, group), columns=[
+        'ID'] + cols).to_pandas().set_index('ID') for group, cols in plan]
+    if not frames:
+        return pd.DataFrame(index=pd.Index([], name='ID'))
+    df = pd.concat(frames, axis=1, join='outer', sort=False)
+    df = df.reindex(frames[0].index.append(
+        df.index.difference(frames[0].index, sort=False)))
+    if columns is not None:
+        df = df[columns]
+    df.index.name = 'ID'
+    return df
+
+
+def export_tsv(store, f, columns=None, groups=None):
+    """Export features in binarena input format.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory.
+    f : str or file handle
+        Output table.
+    columns : list of str, optional
+        Columns to export. Default: all.
+    groups : list of str, optional
+        Column groups to export. Default: all but k-mer tables.
+    """
+    if groups is None:
+        groups = [x for x in list_groups(store) if not x.startswith(
+            'kmers.')]
+    read_store(store, columns, groups).to_csv(f, sep='\t')
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = os.path.join(self.tmpdir, 'test.features')
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    @unittest.skipIf(__import__('importlib').util.find_spec(
+        'pyarrow') is None, 'requires pyarrow')
+    def test_store(self):
+        basic = pd.DataFrame({'length': [100, 200, 300], 'GC': [
+            50.0, 40.0, 60.0]}, index=['c1', 'c2', 'c3'])
+        write_group(self.store, 'basic', basic)
+        with GroupWriter(self.store, 'kmers.k1', list('ACGT')) as writer:
+            writer.write(['c2', 'c1'], [[1, 2, 3, 4], [5, 6, 7, 8]])
+            writer.write(['c3'], [[0, 0, 1, 1]])
+        pca = pd.DataFrame({'4PC1': [0.1, 0.2], 'length': [1, 2]},
+                           index=['c3', 'c1'])
+        write_group(self.store, 'pca4', pca)
+
+        obs = list_groups(self.store)
+        self.assertListEqual(list(obs), ['basic', 'kmers.k1', 'pca4'])
+        self.assertListEqual(obs['kmers.k1'], list('ACGT'))
+
+        obs = read_store(self.store, columns=['A', '4PC1'])
+        self.assertListEqual(obs.index.tolist(), ['c2', 'c1', 'c3'])
+        self.assertListEqual(obs['A'].tolist(), [1, 5, 0])
+        self.assertTrue(np.isnan(obs.loc['c2', '4PC1']))
+
+        fp = os.path.join(self.tmpdir, 'out.tsv')
+        export_tsv(self.store, fp)
+        obs = pd.read_table(fp, index_col=0)
+        self.assertListEqual(obs.columns.tolist(), ['length', 'GC', '4PC1'])
+        self.assertListEqual(obs.index.tolist(), ['c1', 'c2', 'c3'])
+        self.assertListEqual(obs['length'].tolist(), [100, 200, 300])
+
+        with self.assertRaises(ValueError):
+            read_store(self.store, columns=['X'])
+
+
+if __name__ == "__main__":
+    main()
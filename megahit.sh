@@ -64,6 +64,9 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
+# Assembly statistics (per-contig table and N50/GC summary)
+python3 /home/ark/MAB/bin/HoundSleuth/sequence_basics.py -i ${OUT}/final.contigs.fa -a megahit -o ${OUT}/contigs.basic.tsv -S ${OUT}/assembly_stats.json
+
 sleep 5
 
 # Archive results
@@ -2,123 +2,246 @@
 
 import argparse
 import csv
+import os
 import re
-from Bio import SeqIO
+import sqlite3
+import tempfile
+import unittest
 from collections import defaultdict
 
+# version of the indexed store layout (a store of another version is rebuilt)
+STORE_VERSION = "2"
+
+HEADER = ("assembly\tbioproject\tbiosample\torganism\tstrain\tassembly_level\tgenome_rep\tseq_release\tasm_name\t"
+          "asm_submitter\tgbk_accession\texcluded\tgroup\tgenome_size\tperc_gapped\tgc\treplicons\tscaffolds\t"
+          "contigs\tannotation_provider\tgenes\tcds\tnoncoding\n")
+
+# columns of ncbi_assembly_info.tsv written to the output table (perc_gapped is inserted after genome_size)
+FIELDS = (0, 1, 2, 7, 8, 11, 13, 14, 15, 16, 17, 20, 24, 25)
+FIELDS2 = (27, 28, 29, 30, 32, 34, 35, 36)
+
 def parse_args():
     parser = argparse.ArgumentParser(description="pull relevant rows from ncbi_assemly_info.tsv file")
     parser.add_argument("-n", "--ncbi", required=True, help="ncbi")
-    parser.add_argument("-g", "--genera", required=True, help="genera")
+    parser.add_argument("-g", "--genera", required=False, help="genera")
     parser.add_argument("-s", "--species", required=False, help="species", default=".")
     parser.add_argument("-t", "--strain", required=False, help="strain", default=".")
-    parser.add_argument("-o", "--output", required=True, help="Output CSV file")
-    parser.add_argument("-o2", "--output2", required=True, help="Output CSV file")
+    parser.add_argument("-q", "--queries", required=False, help="file of taxon queries, one per line: genus, and "
+                        "optionally species and strain, tab-separated. Matches of each query are written to "
+                        "<output>.q1.tsv, <output>.q2.tsv, etc. (numbered after -g if also given), all matches to "
+                        "the output, and the merged accessions to output2")
+    parser.add_argument("-o", "--output", required=False, help="Output CSV file")
+    parser.add_argument("-o2", "--output2", required=False, help="Output CSV file")
+    parser.add_argument("-d", "--db", required=False, help="indexed store of the ncbi file (default: <ncbi>.sqlite), "
+                        "built or rebuilt when the ncbi file changes")
+    parser.add_argument("-b", "--build", action="store_true", help="only build the indexed store, if needed")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.build and not ((args.genera or args.queries) and args.output and args.output2):
+        parser.error("the following arguments are required: -g/--genera or -q/--queries, -o/--output, -o2/--output2")
+    return args
 
 def load_fasta_sequences(fasta_file):
+    from Bio import SeqIO
     return {record.id: str(record.seq) for record in SeqIO.parse(fasta_file, "fasta")}
 
 def load_fasta_headers(fasta_file):
+    from Bio import SeqIO
     return {record.id: record.description for record in SeqIO.parse(fasta_file, "fasta")}
 
+def parse_row(i):
+    # genus, species and percentage of gaps of a row of ncbi_assembly_info.tsv
+    ls = i.rstrip().split("\t")
+    if len(ls) < 37:
+        raise ValueError("Too few columns.")
+    words = ls[7].split(" ")
+    if words[0] == "Candidatus" and len(words) > 1:
+        genus = words[1]
+        species = words[2] if len(words) > 2 else ""
+    else:
+        genus = words[0]
+        species = words[1] if len(words) > 1 else ""
+    perc_gapped = (1 - (float(ls[26]) / float(ls[25]))) * 100
+    return genus, species, perc_gapped
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {"version": STORE_VERSION, "size": str(st.st_size), "mtime": str(st.st_mtime_ns)}
+
+def build_store(ncbi, db):
+    """Convert ncbi_assembly_info.tsv into an indexed SQLite store.
+
+    Rows are stored with their genus, species, accession and percentage of gaps, and the raw line, such that
+    strain patterns can still be matched against the whole line. Distinct genera are also stored in a table of
+    their own. Malformed rows are skipped.
+
+    The store is built in a private temporary file beside db and then renamed into place, such that concurrent
+    builds do not interfere, and readers never see a partial store.
+    """
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(db) or ".")
+    os.close(fd)
+    try:
+        _build_store(ncbi, tmp)
+        # mkstemp creates the file readable by the owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, db)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def _build_store(ncbi, tmp):
+    conn = sqlite3.connect(tmp)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE assembly (id INTEGER PRIMARY KEY, accession TEXT, genus TEXT, species TEXT, "
+                 "perc_gapped REAL, line TEXT)")
+    skipped = 0
+    batch = []
+    with open(ncbi, "r") as f:
+        for i in f:
+            if i.startswith("#"):
+                continue
+            try:
+                genus, species, perc_gapped = parse_row(i)
+            except (IndexError, ValueError, ZeroDivisionError):
+                skipped += 1
+                continue
+            batch.append((i.split("\t", 1)[0], genus, species, perc_gapped, i.rstrip()))
+            if len(batch) >= 100000:
+                conn.executemany("INSERT INTO assembly (accession, genus, species, perc_gapped, line) "
+                                 "VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+    conn.executemany("INSERT INTO assembly (accession, genus, species, perc_gapped, line) VALUES (?, ?, ?, ?, ?)",
+                     batch)
+    conn.execute("CREATE INDEX genus_idx ON assembly (genus, species)")
+    conn.execute("CREATE INDEX accession_idx ON assembly (accession)")
+    conn.execute("CREATE TABLE genus (name TEXT PRIMARY KEY)")
+    conn.execute("INSERT INTO genus SELECT DISTINCT genus FROM assembly")
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", source_stamp(ncbi).items())
+    conn.commit()
+    conn.close()
+    if skipped:
+        print(f"Skipped {skipped} malformed rows of {ncbi}.")
+
+def open_store(ncbi, db=None):
+    """Open the indexed store of an ncbi_assembly_info.tsv file, (re)building it if the file has changed.
+    """
+    db = db or ncbi + ".sqlite"
+    stamp = source_stamp(ncbi)
+    if os.path.isfile(db):
+        conn = sqlite3.connect(db)
+        try:
+            if dict(conn.execute("SELECT key, value FROM meta")) == stamp:
+                return conn
+        except sqlite3.DatabaseError:
+            pass
+        conn.close()
+    print(f"Building indexed store {db}...")
+    try:
+        build_store(ncbi, db)
+    except (OSError, sqlite3.OperationalError) as e:
+        exit(f"Cannot build indexed store {db} ({e}). Specify a writable location with -d.")
+    return sqlite3.connect(db)
+
+def read_queries(path):
+    # genus, species and strain patterns of each line of a query file
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            ls = [x.strip() or "." for x in line.rstrip("\r\n").split("\t")] + [".", "."]
+            queries.append(tuple(ls[:3]))
+    return queries
+
+def query_batch(conn, queries):
+    """Find rows matching any of several (genera, species, strain) queries in one indexed lookup.
+
+    Each query matches as re.search would on each row: the genus pattern against the genus, the species pattern
+    (if longer than one character, case-insensitive) against the species, and then the strain pattern (if longer
+    than one character) against the whole line. Genus patterns are applied to the table of distinct genera only,
+    and matching rows are then looked up by index.
+
+    Returns a list of (genus, perc_gapped, line, indices of matching queries), in the order of the ncbi file.
+    """
+    distinct = [x for x, in conn.execute("SELECT name FROM genus")]
+    genera = [set(x for x in distinct if re.search(q[0], x)) for q in queries]
+    union = sorted(set().union(*genera))
+    rows = []
+    for k in range(0, len(union), 500):
+        chunk = union[k:k + 500]
+        rows.extend(conn.execute(f"SELECT id, genus, species, perc_gapped, line FROM assembly WHERE genus IN "
+                                 f"({','.join('?' * len(chunk))})", chunk))
+    rows.sort()
+    patterns = [(species.lower() if len(species.lower()) > 1 else None, strain if len(strain) > 1 else None)
+                for _, species, strain in queries]
+    res = []
+    for _, genus, sp, perc_gapped, line in rows:
+        hits = []
+        for n, (species, strain) in enumerate(patterns):
+            if genus not in genera[n]:
+                continue
+            if species is not None:
+                if not re.search(species, sp.lower()):
+                    continue
+                if strain is not None and not re.search(strain, line):
+                    continue
+            hits.append(n)
+        if hits:
+            res.append((genus, perc_gapped, line, hits))
+    return res
+
+def query_store(conn, genera, species=".", strain="."):
+    """Find rows whose genus, species and whole line match the patterns (see query_batch).
+    """
+    return [x[:3] for x in query_batch(conn, [(genera, species, strain)])]
+
+def format_row(line, perc_gapped):
+    ls = line.split("\t")
+    return "\t".join([ls[x] for x in FIELDS] + [f"{perc_gapped:.2f}"] + [ls[x] for x in FIELDS2]) + "\n"
+
 def main():
     args = parse_args()
 
-    dupDict = defaultdict(list)
+    conn = open_store(args.ncbi, args.db)
+    if args.build:
+        return
 
-    # Open the NCBI assembly info file
-    ncbi = open(args.ncbi, "r")
+    queries = [(args.genera, args.species, args.strain)] if args.genera else []
+    if args.queries:
+        queries += read_queries(args.queries)
+
+    dupDict = defaultdict(list)
 
     out2 = open(args.output2, "w")
 
     out = open(args.output, "w")
-    out.write("assembly\tbioproject\tbiosample\torganism\tstrain\tassembly_level\tgenome_rep\tseq_release\tasm_name\tasm_submitter\tgbk_accession\texcluded\tgroup\tgenome_size\tperc_gapped\tgc\treplicons\tscaffolds\tcontigs\tannotation_provider\tgenes\tcds\tnoncoding\n")
-    for i in ncbi:
-        if re.match(r'^#', i):
-            pass
-        else:
-            ls = i.rstrip().split("\t")
-            assembly = ls[0]
-            db = assembly.split("_")[0]
-            acc = assembly.split("_")[1]
-            bioproject = ls[1]
-            biosample = ls[2]
-            organism = ls[7]
-            genus = organism.split(" ")[0]
-            if genus == "Candidatus":
-                genus = organism.split(" ")[1]
-                species = organism.split(" ")[2] if len(organism.split(" ")) > 2 else ""
-            else:
-                species = organism.split(" ")[1] if len(organism.split(" ")) > 1 else ""
-            strain = ls[8]
-            assembly_level = ls[11]
-            genome_rep = ls[13]
-            seq_release = ls[14]
-            asm_name = ls[15]
-            asm_submitter = ls[16]
-            gbk_accession = ls[17]
-            excluded = ls[20]
-            group = ls[24]
-            genome_size = ls[25]
-            perc_gapped = (1 - (float(ls[26]) / float(ls[25]))) * 100
-            gc = ls[27]
-            replicons = ls[28]
-            scaffolds = ls[29]
-            contigs = ls[30]
-            annotation_provider = ls[32]
-            genes = ls[34]
-            cds = ls[35]
-            noncoding = ls[36]
-            if re.search(args.genera, genus): # genera is always provided as it is mandatory
-                print(genus)
-                if len(args.species.lower()) > 1: # species name provided
-
-                    if re.search(args.species.lower(), species.lower()): # but does it match?
-
-                        if len(args.strain) > 1: # strain name provided
-
-                            if re.search(args.strain, i.rstrip()): # but does it match?
-
-                                out.write(f"{assembly}\t{bioproject}\t{biosample}\t"
-                                          f"{organism}\t{strain}\t{assembly_level}\t{genome_rep}\t"
-                                          f"{seq_release}\t{asm_name}\t{asm_submitter}\t{gbk_accession}\t"
-                                          f"{excluded}\t{group}\t{genome_size}\t{perc_gapped:.2f}\t{gc}\t"
-                                          f"{replicons}\t{scaffolds}\t{contigs}\t"
-                                          f"{annotation_provider}\t{genes}\t{cds}\t{noncoding}\n")
-
-                                # out2.write(f"{assembly}\n")
-                                dupDict[acc].append(db)
-
-                            else:
-                                continue
-
-                        else:
-                            out.write(f"{assembly}\t{bioproject}\t{biosample}\t"
-                                      f"{organism}\t{strain}\t{assembly_level}\t{genome_rep}\t"
-                                      f"{seq_release}\t{asm_name}\t{asm_submitter}\t{gbk_accession}\t"
-                                      f"{excluded}\t{group}\t{genome_size}\t{perc_gapped:.2f}\t{gc}\t"
-                                      f"{replicons}\t{scaffolds}\t{contigs}\t"
-                                      f"{annotation_provider}\t{genes}\t{cds}\t{noncoding}\n")
-
-                            # out2.write(f"{assembly}\n")
-                            dupDict[acc].append(db)
-                    else:
-                        continue
-                else:
-                    out.write(f"{assembly}\t{bioproject}\t{biosample}\t"
-                              f"{organism}\t{strain}\t{assembly_level}\t{genome_rep}\t"
-                              f"{seq_release}\t{asm_name}\t{asm_submitter}\t{gbk_accession}\t"
-                              f"{excluded}\t{group}\t{genome_size}\t{perc_gapped:.2f}\t{gc}\t"
-                              f"{replicons}\t{scaffolds}\t{contigs}\t"
-                              f"{annotation_provider}\t{genes}\t{cds}\t{noncoding}\n")
-
-                    # out2.write(f"{assembly}\n")
-                    dupDict[acc].append(db)
-
-            else:
-                continue
+    out.write(HEADER)
+
+    # per-query match tables
+    outs = []
+    if args.queries:
+        root, ext = os.path.splitext(args.output)
+        for n in range(len(queries)):
+            outs.append(open(f"{root}.q{n + 1}{ext or '.tsv'}", "w"))
+            outs[-1].write(HEADER)
+
+    for genus, perc_gapped, line, hits in query_batch(conn, queries):
+        print(genus)
+        row = format_row(line, perc_gapped)
+        out.write(row)
+        for n in hits if outs else ():
+            outs[n].write(row)
+        assembly = line.split("\t", 1)[0]
+        db, acc = assembly.split("_")[:2]
+        dupDict[acc].append(db)
+    out.close()
+    for f in outs:
+        f.close()
+    conn.close()
 
     for i in dupDict.keys():
         if "GCF" in dupDict[i]:
@@ -127,5 +250,54 @@ def main():
             out2.write(f"GCA_{i}\n")
     out2.close()
 
+class Tests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.ncbi = os.path.join(self.tmpdir, "ncbi_assembly_info.tsv")
+        rows = [("GCF_000001.1", "Escherichia coli", "K-12"),
+                ("GCA_000001.1", "Escherichia coli", "K-12"),
+                ("GCA_000002.1", "Candidatus Pelagibacter ubique", "HTCC1062"),
+                ("GCA_000003.1", "Escherichia albertii", "B156"),
+                ("GCA_000004.1", "Shigella flexneri", "2a")]
+        with open(self.ncbi, "w") as f:
+            f.write("#assembly_accession\tbioproject\n")
+            for acc, organism, strain in rows:
+                ls = [acc, "PRJ", "SAM"] + ["x"] * 34
+                ls[7], ls[8], ls[25], ls[26] = organism, f"strain={strain}", "1000", "900"
+                f.write("\t".join(ls) + "\n")
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    def test_query_store(self):
+        conn = open_store(self.ncbi)
+        obs = [x[2].split("\t")[0] for x in query_store(conn, "^Esch")]
+        self.assertListEqual(obs, ["GCF_000001.1", "GCA_000001.1", "GCA_000003.1"])
+        obs = [x[2].split("\t")[0] for x in query_store(conn, "Pelagi", "UBI")]
+        self.assertListEqual(obs, ["GCA_000002.1"])
+        obs = query_store(conn, "Esch", "coli", "K-12")
+        self.assertEqual(len(obs), 2)
+        self.assertAlmostEqual(obs[0][1], 10.0)
+        self.assertListEqual(query_store(conn, "Esch", "coli", "B156"), [])
+        self.assertEqual(format_row(obs[0][2], obs[0][1]).split("\t")[14], "10.00")
+        obs = [(x[2].split("\t")[0], x[3]) for x in query_batch(conn, [
+            ("Esch", "coli", "B156"), ("^Shig|Pelagi", ".", "."), ("Escherichia", "alb", ".")])]
+        self.assertListEqual(obs, [("GCA_000002.1", [1]), ("GCA_000003.1", [2]), ("GCA_000004.1", [1])])
+        conn.close()
+
+        # rebuild when the source changes
+        with open(self.ncbi, "a") as f:
+            f.write("malformed\n")
+        os.utime(self.ncbi, ns=(0, 0))
+        conn = open_store(self.ncbi)
+        self.assertEqual(len(query_store(conn, ".")), 5)
+        self.assertListEqual(sorted(x for x, in conn.execute("SELECT name FROM genus")),
+                             ["Escherichia", "Pelagibacter", "Shigella"])
+        conn.close()
+        self.assertListEqual(sorted(os.listdir(self.tmpdir)), ["ncbi_assembly_info.tsv",
+                                                               "ncbi_assembly_info.tsv.sqlite"])
+
 if __name__ == "__main__":
     main()
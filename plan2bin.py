@@ -2,8 +2,10 @@
 
 import argparse
 import os
-from collections import defaultdict
-from Bio import SeqIO
+import gzip
+import unittest
+from collections import OrderedDict, defaultdict
+from fasta_reader import read_fasta_lines
 
 def parse_tsv(tsv_file):
     contig_to_bin = {}
@@ -17,10 +19,17 @@ def parse_tsv(tsv_file):
                 contig_to_bin[parts[0]] = None
     return contig_to_bin
 
-def write_bins(contig_to_bin, fasta_file, output_dir):
+def bin_path(output_dir, bin_name, compress=False):
+    return os.path.join(output_dir, f"{bin_name}.fasta" + (".gz" if compress else ""))
+
+def write_bins(contig_to_bin, fasta_file, output_dir, unbinned=False, compress=False):
+    try:
+        from Bio import SeqIO
+    except ModuleNotFoundError:
+        exit("Biopython is not installed. Use streaming mode (-s) instead.")
     os.makedirs(output_dir, exist_ok=True)
     bin_seqs = defaultdict(list)
-    unbinned = []
+    unbinned_seqs = []
 
     for record in SeqIO.parse(fasta_file, "fasta"):
         contig_id = record.id
@@ -28,28 +37,115 @@ def write_bins(contig_to_bin, fasta_file, output_dir):
         if bin_name:
             bin_seqs[bin_name].append(record)
         else:
-            unbinned.append(record)
+            unbinned_seqs.append(record)
 
     # Write binned sequences
+    if unbinned and unbinned_seqs:
+        bin_seqs["unbinned"] = unbinned_seqs
+    opener = gzip.open if compress else open
     for bin_name, records in bin_seqs.items():
-        bin_path = os.path.join(output_dir, f"{bin_name}.fasta")
-        SeqIO.write(records, bin_path, "fasta")
+        with opener(bin_path(output_dir, bin_name, compress), "wt") as f:
+            SeqIO.write(records, f, "fasta")
+
+class FilePool:
+    """Bounded pool of open output files, closing the least recently used.
+
+    A file is truncated when first opened, and appended to when reopened.
+    """
+    def __init__(self, max_open=256, compress=False):
+        self.max_open = max(1, max_open)
+        self.opener = gzip.open if compress else open
+        self.handles = OrderedDict()
+        self.opened = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, path):
+        fh = self.handles.get(path)
+        if fh is not None:
+            self.handles.move_to_end(path)
+            return fh
+        if len(self.handles) >= self.max_open:
+            self.handles.popitem(last=False)[1].close()
+        fh = self.opener(path, "ab" if path in self.opened else "wb")
+        self.opened.add(path)
+        self.handles[path] = fh
+        return fh
 
-    # # Write unbinned sequences
-    # if unbinned:
-    #     unbinned_path = os.path.join(output_dir, "unbinned.fasta")
-    #     SeqIO.write(unbinned, unbinned_path, "fasta")
+    def close(self):
+        for fh in self.handles.values():
+            fh.close()
+        self.handles.clear()
+
+def write_bins_stream(contig_to_bin, fasta_file, output_dir, unbinned=False, compress=False, max_open=256):
+    # read the assembly once, and append each contig to its bin file as it comes
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    with open(fasta_file, "rb") as f, FilePool(max_open, compress) as pool:
+        out = None
+        for title, line in read_fasta_lines(f):
+            if title is not None:
+                bin_name = contig_to_bin.get((title.split() or [""])[0])
+                if not bin_name and unbinned:
+                    bin_name = "unbinned"
+                if bin_name:
+                    if bin_name not in paths:
+                        paths[bin_name] = bin_path(output_dir, bin_name, compress)
+                    out = pool.get(paths[bin_name])
+                    out.write(b">" + title.encode() + b"\n")
+                else:
+                    out = None
+            elif out is not None and line:
+                out.write(line + b"\n")
 
 def main():
     parser = argparse.ArgumentParser(description="Separate contigs into bin files based on TSV map.")
     parser.add_argument("-t", "--tsv", required=True, help="Input TSV file with contig and bin name")
     parser.add_argument("-f", "--fasta", required=True, help="Input FASTA file with contigs")
     parser.add_argument("-o", "--outdir", required=True, help="Output directory to store binned FASTA files")
+    parser.add_argument("-s", "--stream", action="store_true", help="Stream contigs into bin files as they are read (constant memory, without Biopython)")
+    parser.add_argument("-m", "--max-open", type=int, default=256, help="Maximum number of bin files open at once in streaming mode (default: 256)")
+    parser.add_argument("-u", "--unbinned", action="store_true", help="Also write unbinned contigs to unbinned.fasta")
+    parser.add_argument("-z", "--gzip", action="store_true", help="Write gzip-compressed bin files (.fasta.gz)")
 
     args = parser.parse_args()
 
     contig_to_bin = parse_tsv(args.tsv)
-    write_bins(contig_to_bin, args.fasta, args.outdir)
+    if args.stream:
+        write_bins_stream(contig_to_bin, args.fasta, args.outdir, args.unbinned, args.gzip, args.max_open)
+    else:
+        write_bins(contig_to_bin, args.fasta, args.outdir, args.unbinned, args.gzip)
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    def test_write_bins_stream(self):
+        fasta = os.path.join(self.tmpdir, "in.fa")
+        with open(fasta, "w") as f:
+            f.write(">c1 first\nACGT\nAC\n>c2\nGG\n>c3\nTT\n>c4\nCC\n")
+        contig_to_bin = {"c1": "b1", "c2": "b2", "c3": "b1", "c4": None}
+        outdir = os.path.join(self.tmpdir, "out")
+        write_bins_stream(contig_to_bin, fasta, outdir, unbinned=True, max_open=1)
+        obs = {x: open(os.path.join(outdir, x)).read() for x in os.listdir(outdir)}
+        self.assertDictEqual(obs, {
+            "b1.fasta": ">c1 first\nACGT\nAC\n>c3\nTT\n",
+            "b2.fasta": ">c2\nGG\n", "unbinned.fasta": ">c4\nCC\n"})
+
+        outdir = os.path.join(self.tmpdir, "gz")
+        write_bins_stream(contig_to_bin, fasta, outdir, compress=True, max_open=1)
+        self.assertListEqual(sorted(os.listdir(outdir)), ["b1.fasta.gz", "b2.fasta.gz"])
+        with gzip.open(os.path.join(outdir, "b1.fasta.gz"), "rt") as f:
+            self.assertEqual(f.read(), ">c1 first\nACGT\nAC\n>c3\nTT\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
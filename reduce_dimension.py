@@ -4,9 +4,17 @@
 Usage:
     python me.py -i kmer_freqs.tsv --pca --tsne --umap -o output
 
+    python me.py -i k4.kmat k5.kmat k6.kmat -o out.k4 out.k5 out.k6
+        -x 4 5 6 --pca --tsne --umap -t 16
+
 Output:
     output.pca.tsv, output.tsne.tsv, output.umap.tsv
 
+Input:
+    Either a tab-separated table, or a binary k-mer matrix generated by
+    count_kmers.py (-f bin), which is detected automatically and mapped into
+    memory (see kmer_matrix.py).
+
 Notes:
     This script performs choice of three common dimensionality reduction
     methods: PCA, t-SNE, and UMAP. It is suitable for converting multiple
@@ -17,39 +25,116 @@ Notes:
     perform UMAP, it also requires the Python library umap-learn.
 
     The procedures are:
-    0. Read data table.
+    0. Read data table (as 32-bit floats, in chunks of rows).
     1. Add a pseudocount (default: 1) to any feature that has zeros.
     2. Perform centered log-ratio transform (CLR) on each feature.
     3. Perform principal component analysis (PCA).
-    4. If there are >200 features, perform PCA to reduce to 50 features.
+    4. If there are >200 features, perform PCA to reduce to 50 (-f) features.
     5. Perform t-distributed stochastic neighbor embedding (t-SNE).
     6. Perform Uniform manifold approximation and projection (UMAP).
+
+    Steps 0-2 are performed in place on a single 32-bit float matrix, without
+    intermediate copies of the data. Use --double to keep 64-bit precision.
+    Peak memory usage is reported at the end.
+
+    With --incremental, the input file is streamed twice in chunks of rows
+    (-c): once to fit incremental PCA models (for the PCA output and for the
+    feature extraction of step 4), and once to transform the data. Steps 1-4
+    are performed chunk by chunk, such that memory usage is bounded by the
+    chunk size instead of the number of samples, and run time grows linearly
+    with the number of samples. The number of extracted features is capped by
+    the chunk size.
+
+    A single k-nearest neighbor graph of the data is built for each input and
+    shared by t-SNE engine bh (as a sparse matrix of squared distances) and
+    UMAP (as precomputed neighbors), using NN-descent if library pynndescent
+    (a dependency of umap-learn) is available, otherwise an exact search. The
+    default t-SNE engine uses exact distances of all samples.
+
+    t-SNE is performed on exact distances with a fixed perplexity of 2 using
+    scikit-learn by default, as in earlier versions. For large inputs
+    (--tsne-large), or if chosen (--tsne-engine), the perplexity is scaled
+    with the number of samples, and t-SNE is performed using FFT-accelerated
+    interpolation (requires openTSNE), or Barnes-Hut on the nearest neighbor
+    graph using scikit-learn, either with the given number of threads.
+
+    For large inputs, t-SNE and UMAP may be fitted on a sample (--sample):
+    all sequences of at least a minimum length (--min-length), plus a random
+    sample of shorter ones, drawn with probabilities proportional to length.
+    Lengths are read from a table (-l), or approximated by the total k-mer
+    counts of rows (halved for tables that count both strands). The remaining
+    samples are projected onto the fitted embedding, by the out-of-sample
+    transform of UMAP and openTSNE, or by averaging the coordinates of nearest
+    fitted neighbors, such that every sample is included in the output.
+
+    With --model, fitted models (PCA, feature extraction and UMAP), along
+    with the results and the parameters (including pseudocount), are saved
+    to output.model.pkl, keyed by a hash of the input matrix and of each row.
+    A later run with the same parameters loads them, reuses the results of
+    known rows, and only transforms new rows: by PCA and UMAP models, or, for
+    t-SNE, by averaging the coordinates of nearest known rows.
+
+    Optionally, embeddings are also written as column groups (e.g., pca4,
+    umap4) of a feature store (--store; see feature_store.py).
+
+    Multiple input files can be processed in one run, each with its own
+    output stem (-o) and optional column prefix (-x). Reading, PCA and feature
+    extraction of each input, as well as t-SNE and UMAP, are run as separate
+    jobs in a pool of processes, within a budget of CPU cores (-t) that is
+    shared among concurrent jobs. With a column prefix, the output columns are
+    named like "4PC1", "4tsne1" and "4UM1", and the index is named "ID", as
+    required by binarena-combine.py.
 """
 
+import os
+import io
 import sys
 import argparse
+import resource
+import pickle
+import unittest
+from hashlib import blake2b
 from random import randint
+from multiprocessing import Pool
 
 import numpy as np
 import pandas as pd
 
+from kmer_matrix import (
+    MAGIC, MatrixError, is_matrix, read_matrix, read_matrix_bytes)
+
 try:
-    from sklearn.decomposition import PCA
-    from sklearn.manifold import TSNE
+    from sklearn.decomposition import PCA, IncrementalPCA
     from sklearn.manifold import TSNE
 except ModuleNotFoundError:
     exit('This script requires Python library scikit-learn.')
 
 
+# number of neighbors of UMAP
+UMAP_NEIGHBORS = 15
+
+# display names of methods
+NAMES = {'pca': 'PCA', 'tsne': 't-SNE', 'umap': 'UMAP'}
+
+# output column names of methods: default, and with a prefix
+COLUMNS = {'pca': ('PC', 'PC'), 'tsne': ('tSNE', 'tsne'),
+           'umap': ('UMAP', 'UM')}
+
+
+class InputError(ValueError):
+    """Input data is not suitable for analysis.
+    """
+
+
 def parse_args():
     """Command-line interface.
     """
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter)
     arg = parser.add_argument
-    arg('-i', '--input', type=argparse.FileType('r'), default=sys.stdin,
-        help=('input data table (tab-separated, rows as samples, columns as '
-              'features), default: stdin'))
+    arg('-i', '--input', type=str, nargs='+', default=['-'],
+        help=('input data table(s) (tab-separated or binary k-mer matrix, '
+              'rows as samples, columns as features), default: stdin'))
     arg('--pca', action='store_true', help='perform PCA')
     arg('--tsne', action='store_true', help='perform t-SNE')
     arg('--umap', action='store_true', help='perform UMAP')
@@ -58,11 +143,51 @@ def parse_args():
     arg('-p', '--pseudocount', type=float, default=1.0,
         help=('pseudocount to add to cell values of a feature if there are '
               'zeros, default: 1.0'))
+    arg('-c', '--chunksize', type=int, default=10000,
+        help='number of rows per chunk when reading and transforming data, '
+             'default: 10000')
+    arg('--incremental', action='store_true',
+        help=('stream data from file in chunks of rows and perform '
+              'incremental PCA, using bounded memory'))
+    arg('--double', action='store_true',
+        help='use 64-bit instead of 32-bit floats')
     arg('-s', '--seed', type=int, help='random seed')
+    arg('--tsne-engine', type=str, default='auto',
+        choices=['auto', 'sklearn', 'bh', 'fft'],
+        help=('t-SNE engine: sklearn (exact distances, perplexity 2, as in '
+              'earlier versions; default for small inputs), bh (Barnes-Hut '
+              'on the nearest neighbor graph, scaled perplexity), fft '
+              '(openTSNE, FFT-accelerated interpolation, scaled perplexity), '
+              'default: auto'))
+    arg('--tsne-large', type=int, default=50000,
+        help=('minimum number of samples to use engine fft (or bh if '
+              'openTSNE is not available) in auto mode, default: 50000'))
     arg('-r', '--learning-rate', type=float,
         help='learning rate for t-SNE and UMAP')
-    arg('-o', '--output', type=str, help='output filepath stem')
-    arg('-f', '--features', type=str, help='number of contigs')
+    arg('--sample', type=int,
+        help=('fit t-SNE and UMAP on all long samples plus up to this number '
+              'of shorter ones (sampled by length), and project the rest'))
+    arg('--min-length', type=int, default=2500,
+        help=('minimum length of samples to be always included in fitting, '
+              'default: 2500'))
+    arg('-l', '--lengths', type=str,
+        help=('table of sample lengths (e.g., output of sequence_basics.py), '
+              'default: approximate by row sums of k-mer counts (per strand)'))
+    arg('-m', '--model', action='store_true',
+        help=('save fitted models next to outputs, and reuse them in later '
+              'runs to only transform new rows'))
+    arg('--store', type=str,
+        help='also write embeddings to feature store directory')
+    arg('-o', '--output', type=str, nargs='+', required=True,
+        help='output filepath stem(s), one per input')
+    arg('-x', '--prefix', type=str, nargs='+',
+        help=('prefix of output column names, one per input (e.g., k-mer '
+              'size: 4PC1, 4tsne1, 4UM1)'))
+    arg('-t', '--threads', type=int, default=1,
+        help='number of CPU cores to use, default: 1')
+    arg('-f', '--features', type=int, default=50,
+        help=('number of features to extract for t-SNE and UMAP if there are '
+              'more than 200, default: 50'))
     for arg in parser._actions:
         arg.metavar = ''
     if len(sys.argv) == 1:
@@ -75,100 +200,1293 @@ def parse_args():
 def main():
     args = parse_args()
 
-    # parameters
-    output = args.output
-    ndim = args.ndim
-    pseudo = args.pseudocount
-    axes = [i + 1 for i in range(ndim)]
+    # input files, output stems and column prefixes
+    inputs, outputs, prefixes = args.input, args.output, args.prefix
+    if len(outputs) != len(inputs):
+        exit('Numbers of input files and output stems do not match.')
+    if prefixes is None:
+        prefixes = [None] * len(inputs)
+    elif len(prefixes) != len(inputs):
+        exit('Numbers of input files and column prefixes do not match.')
+    for fp in inputs:
+        if fp == '-':
+            if len(inputs) > 1:
+                exit('Standard input cannot be combined with other inputs.')
+            if args.incremental:
+                exit('Incremental PCA requires a regular input file.')
+        elif not os.path.exists(fp):
+            exit(f'Input file {fp} does not exist.')
+        elif args.incremental and not os.path.isfile(fp):
+            exit('Incremental PCA requires a regular input file.')
+    if args.model and args.incremental:
+        exit('Saving models is not supported in incremental mode.')
+    if args.features < 1:
+        exit('Number of features (-f) must be positive.')
+    if args.tsne and args.tsne_engine == 'fft':
+        try:
+            import openTSNE  # noqa: F401
+        except ModuleNotFoundError:
+            exit('This function requires Python library openTSNE.')
+    if args.umap:
+        try:
+            import umap  # noqa: F401
+        except ModuleNotFoundError:
+            exit('This function requires Python library umap-learn.')
 
     # random seed
     seed = args.seed
     if seed is None:
         seed = randint(1, 1000)
+        args.seed = seed
     print(f'Use random seed {seed}.')
 
     # learning rate
-    if args.tsne or args.umap:
+    methods = [x for x in ('tsne', 'umap') if getattr(args, x)]
+    if methods:
         rate = args.learning_rate
-        text = []
-        if args.tsne:
-            text.append('t-SNE')
-        if args.umap:
-            text.append('UMAP')
-        text = ' and '.join(text)
+        text = ' and '.join(NAMES[x] for x in methods)
         print(f'Use learning rate {rate} for {text}.')
 
+    # CPU budget: number of concurrent jobs and threads per job
+    nproc = max(1, min(args.threads, len(inputs) * max(1, len(methods))))
+    args.jobthreads = max(1, args.threads // nproc)
+
+    # run jobs, either in current process or in a pool of processes
+    pool = Pool(nproc) if nproc > 1 else None
+    args.pooled = pool is not None
+
+    def submit(func, *params):
+        if pool is None:
+            res = func(*params)
+            return lambda: res
+        return pool.apply_async(func, params).get
+
+    try:
+        jobs = [submit(prepare, fp, out, pfx, args) for fp, out, pfx in zip(
+            inputs, outputs, prefixes)]
+        embeds, states = [], {}
+        for job, out, pfx in zip(jobs, outputs, prefixes):
+            ids, data, graph, mask, state = job()
+            if args.model and state is not None:
+                states[out] = (ids, state)
+            if data is None:
+                continue
+            for method in methods:
+                embeds.append((out, method, submit(
+                    embed, method, ids, data, graph, mask, out, pfx, args)))
+        for out, method, job in embeds:
+            res, model = job()
+            if out in states:
+                states[out][1]['res'][method] = res
+                states[out][1][method] = model
+        for out, (ids, state) in states.items():
+            save_model(out, ids, state, args)
+    except (InputError, MatrixError) as e:
+        exit(str(e))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print(f'Peak memory usage: {peak_memory():.1f} MB.')
+
+
+def prepare(fp, output, prefix, args):
+    """Read and transform data, perform PCA, extract features, and build a
+    nearest neighbor graph.
+
+    Parameters
+    ----------
+    fp : str
+        Input file path, or "-" for stdin.
+    output : str
+        Output filepath stem.
+    prefix : str or None
+        Prefix of output column names.
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    pd.Index
+        Sample identifiers.
+    np.ndarray or None
+        Data for t-SNE and UMAP.
+    tuple of (np.ndarray, np.ndarray, object) or None
+        Nearest neighbor graph of samples to fit, shared by t-SNE engine bh
+        and UMAP, or None if neither is performed (the other t-SNE engines
+        compute their own affinities).
+    np.ndarray of bool or None
+        Samples to fit embeddings on, or None if all.
+    dict or None
+        Fitted models and results to be saved (see `save_model`), or None if
+        saved models were reused.
+    """
+    from threadpoolctl import threadpool_limits
+    with threadpool_limits(args.jobthreads):
+        state = {'res': {}} if args.model else None
+        ids, data, lengths = _prepare(fp, output, prefix, args, state)
+        if state is not None and 'digests' not in state:
+            state = None
+        if state is not None:
+            state['data'] = data
+        if data is None:
+            return ids, None, None, None, state
+
+        # sample rows to fit embeddings
+        mask = None
+        if args.sample:
+            if args.lengths:
+                lengths = read_lengths(args.lengths, ids)
+            mask = sample_rows(lengths, args.min_length, args.sample,
+                               args.seed)
+            nfit = int(mask.sum())
+            print(f'Fit embeddings of {output} on {nfit} of '
+                  f'{mask.shape[0]} samples.')
+            if nfit == mask.shape[0]:
+                mask = None
+        fit = data if mask is None else data[mask]
+
+        # nearest neighbor graph
+        n = fit.shape[0]
+        k = 0
+        if args.tsne and tsne_engine(n, args) == 'bh':
+            k = int(3 * perplexity(n, 'bh') + 1)
+        if args.umap:
+            k = max(k, UMAP_NEIGHBORS)
+        graph = None
+        if k:
+            k = min(k + 1, n)
+            print(f'Building nearest neighbor graph of {output}...')
+            graph = knn_graph(fit, k, args.seed, (
+                None if args.pooled else args.jobthreads))
+            print('Done.')
+    return ids, data, graph, mask, state
+
+
+def _prepare(fp, output, prefix, args, state=None):
+    """Read and transform data, perform PCA, and extract features. Also
+    returns sequence lengths approximated from original data (see
+    `kmer_lengths`).
+
+    If a dictionary `state` is provided, saved models are reused if
+    applicable (in which case None is returned as data), otherwise fitted
+    models and results are added to it.
+    """
+    ndim, pseudo, seed = args.ndim, args.pseudocount, args.seed
+    dtype = np.float64 if args.double else np.float32
+    chunk = args.chunksize
+    label = '' if fp == '-' else f' of {fp}'
+
     # input data
-    df = pd.read_table(args.input, index_col=0).astype(float)
-    ids = df.index
-    data = df.values
+    if args.incremental:
+        ids, data, ncol, npseudo, sums = incremental(
+            fp, output, prefix, args)
+        nrow = ids.shape[0]
+        print(f'Data table{label} has {nrow} samples and {ncol} features.')
+        if npseudo:
+            print(f'Added a pseudocount of {pseudo} to {npseudo} features.')
+        return ids, data, kmer_lengths(sums, ncol)
+
+    if fp == '-':
+        ids, data = read_data(sys.stdin, dtype, chunk)
+    else:
+        with open(fp) as f:
+            ids, data = read_data(f, dtype, chunk)
     nrow, ncol = data.shape
-    print(f'Data table has {nrow} samples and {ncol} features.')
+    print(f'Data table{label} has {nrow} samples and {ncol} features.')
+    lengths = kmer_lengths(data.sum(axis=1), ncol)
+
+    # reuse saved models
+    if state is not None:
+        digests = row_digests(ids, data)
+        model = load_model(output, ncol, args)
+        if model is not None:
+            reuse_model(model, ids, data, digests, output, prefix, args)
+            return ids, None, lengths
+        state.update(digests=digests, ncol=ncol, pca=None, features=None)
 
     # add pseudocount
-    npseudo = 0
-    for datum in data:
-        if np.any(datum == 0):
-            datum += pseudo
-            npseudo += 1
+    npseudo = add_pseudocount(data, pseudo, chunk)
     if npseudo:
         print(f'Added a pseudocount of {pseudo} to {npseudo} features.')
 
     # centered log-ratio transform
-    data = np.log(data)
-    data -= data.mean(axis=-1, keepdims=True)
+    clr(data, chunk)
 
     # Principal component analysis (PCA)
     if args.pca:
-        print('Performing PCA...')
+        print(f'Performing PCA{label}...')
         pca = PCA(n_components=ndim, random_state=seed)
         pca.fit(data)
         print(f'Loadings: {pca.explained_variance_ratio_}')
         res = pca.transform(data)
-        df = pd.DataFrame(res, index=ids, columns=[f'PC{i}' for i in axes])
-        df.to_csv(f'{output}.pca.tsv', sep='\t')
+        write_embedding(res, ids, 'pca', output, prefix, args.store)
+        if state is not None:
+            state['pca'], state['res']['pca'] = pca, res
         print('Done.')
 
-    if (args.tsne or args.umap) and ncol > 200:
+    if not (args.tsne or args.umap):
+        return ids, None, lengths
+
+    if ncol > 200:
         print('Extracting features from original data...')
         n_samples, n_features = data.shape
         max_components = min(n_samples, n_features)
 
-        pca_ = PCA(n_components=min(int(args.features), max_components), random_state=seed)
+        pca_ = PCA(n_components=min(args.features, max_components),
+                   random_state=seed)
         # pca_ = PCA(n_components=int(args.features), random_state=seed)
         data = pca_.fit_transform(data)
+        if state is not None:
+            state['features'] = pca_
         print('Done.')
+    return ids, data, lengths
 
-    # t-distributed stochastic neighbor embedding (t-SNE)
-    if args.tsne:
-        print('Performing t-SNE...')
 
-        n_samples = data.shape[0]  # Get the number of samples
-        perplexity = min(2, n_samples - 1)  # Ensure perplexity < n_samples
+def kmer_lengths(sums, ncol):
+    """Approximate sequence lengths by total k-mer counts of rows.
 
-        tsne = TSNE(n_components=ndim, init='random', perplexity=perplexity,
-                    learning_rate=(rate or 200.0), random_state=seed)
+    Parameters
+    ----------
+    sums : np.ndarray
+        Row sums of a k-mer frequency table.
+    ncol : int
+        Number of columns of table.
 
-        res = tsne.fit_transform(data)
-        df = pd.DataFrame(res, index=ids, columns=[f'tSNE{i}' for i in axes])
-        df.to_csv(f'{output}.tsne.tsv', sep='\t')
-        print('Done.')
+    Returns
+    -------
+    np.ndarray
+        Approximate sequence lengths.
 
-    # Uniform manifold approximation and projection (UMAP)
-    if args.umap:
-        print('Performing UMAP...')
+    Notes
+    -----
+    A sequence of length L has L - k + 1 k-mers per strand. A table of all
+    4^k k-mers counts both strands, whereas a canonical table (see
+    count_kmers.py) counts each position once, except for palindromic k-mers
+    (a fraction of 2^-k of positions if k is even), which are counted twice.
+    The two are told apart by the number of columns. Row sums of other tables
+    are returned as is.
+    """
+    for k in range(1, 16):
+        if ncol == 4 ** k:
+            return sums / 2 + k - 1
+        if ncol == (4 ** k + (0 if k % 2 else 2 ** k)) // 2:
+            return sums / (1 + (0 if k % 2 else 2.0 ** -k)) + k - 1
+    return sums
 
-        try:
+
+def embed(method, ids, data, graph, mask, output, prefix, args):
+    """Perform t-SNE or UMAP on data.
+
+    Parameters
+    ----------
+    method : {'tsne', 'umap'}
+        Embedding method.
+    ids : pd.Index
+        Sample identifiers.
+    data : np.ndarray
+        Data table.
+    graph : tuple of (np.ndarray, np.ndarray, object) or None
+        Nearest neighbor graph of samples to fit (for t-SNE engine bh and
+        UMAP).
+    mask : np.ndarray of bool or None
+        Samples to fit embedding on, or None if all. The remaining samples
+        are projected onto the fitted embedding.
+    output : str
+        Output filepath stem.
+    prefix : str or None
+        Prefix of output column names.
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    np.ndarray
+        Embedding.
+    umap.UMAP or None
+        Fitted UMAP model, if to be saved.
+    """
+    from threadpoolctl import threadpool_limits
+    ndim, rate, seed = args.ndim, args.learning_rate, args.seed
+    fit, rest = (data, None) if mask is None else (data[mask], data[~mask])
+    model = None
+    print(f'Performing {NAMES[method]} of {output}...')
+    with threadpool_limits(args.jobthreads):
+
+        # t-distributed stochastic neighbor embedding (t-SNE)
+        if method == 'tsne':
+            n_samples = fit.shape[0]  # Get the number of samples
+            engine = tsne_engine(n_samples, args)
+            perp = perplexity(n_samples, engine)
+            print(f'Use t-SNE engine {engine} with perplexity {perp:g}.')
+            n_jobs = None if args.pooled else args.jobthreads
+
+            # FFT-accelerated interpolation (openTSNE)
+            if engine == 'fft':
+                from openTSNE import TSNE as FFTSNE
+                tsne = FFTSNE(n_components=ndim, perplexity=perp,
+                              learning_rate=(rate or 'auto'),
+                              negative_gradient_method=(
+                                  'fft' if ndim <= 2 else 'bh'),
+                              initialization='random',
+                              n_jobs=args.jobthreads, random_state=seed)
+                model = tsne.fit(fit)
+                res = np.asarray(model)
+                if rest is not None:
+                    rest = np.asarray(model.transform(rest))
+
+            # Barnes-Hut with scaled perplexity (multithreaded gradient)
+            elif engine == 'bh':
+                tsne = TSNE(n_components=ndim, init='random',
+                            perplexity=perp, learning_rate=(rate or 'auto'),
+                            metric='precomputed', random_state=seed,
+                            n_jobs=n_jobs)
+                res = tsne.fit_transform(knn_sparse(*graph[:2]))
+
+            # default engine (exact distances)
+            else:
+                tsne = TSNE(n_components=ndim, init='random',
+                            perplexity=perp, learning_rate=(rate or 200.0),
+                            metric='euclidean', random_state=seed,
+                            n_jobs=n_jobs)
+                res = tsne.fit_transform(fit)
+
+            # t-SNE has no out-of-sample transform in scikit-learn
+            if engine != 'fft' and rest is not None:
+                rest = project(fit, res, rest, n_jobs=n_jobs)
+
+        # Uniform manifold approximation and projection (UMAP)
+        elif method == 'umap':
             from umap import UMAP
-        except ModuleNotFoundError:
-            exit('This function requires Python library umap-learn.')
+            indices, distances, index = graph
+            knn = None
+            if indices.shape[1] >= UMAP_NEIGHBORS and (
+                    rest is None or index is not None):
+                knn = (indices, distances, index)
+            umap = UMAP(n_components=ndim, n_neighbors=UMAP_NEIGHBORS,
+                        init='random', learning_rate=(rate or 1.0),
+                        precomputed_knn=knn, random_state=seed)
+            res = umap.fit_transform(fit)
+            if rest is not None:
+                rest = umap.transform(rest)
+            if args.model:
+                model = umap
 
-        umap = UMAP(n_components=ndim, init='random', learning_rate=(
-            rate or 1.0), random_state=seed)
-        res = umap.fit_transform(data)
-        df = pd.DataFrame(res, index=ids, columns=[f'UMAP{i}' for i in axes])
-        df.to_csv(f'{output}.umap.tsv', sep='\t')
-        print('Done.')
+    # combine fitted and projected samples
+    if rest is not None:
+        res_ = np.empty((data.shape[0], ndim), dtype=res.dtype)
+        res_[mask], res_[~mask] = res, rest
+        res = res_
+
+    write_embedding(res, ids, method, output, prefix, args.store)
+    print('Done.')
+    return res, model
+
+
+def project(fit, res, rest, k=UMAP_NEIGHBORS, n_jobs=None):
+    """Project samples onto an embedding by averaging the coordinates of
+    their nearest neighbors.
+
+    Parameters
+    ----------
+    fit : np.ndarray of shape (n, m)
+        Data of samples that were embedded.
+    res : np.ndarray of shape (n, d)
+        Embedding of these samples.
+    rest : np.ndarray of shape (n_rest, m)
+        Data of samples to project.
+    k : int, optional
+        Number of neighbors.
+    n_jobs : int, optional
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray of shape (n_rest, d)
+        Projected coordinates, which are the averages of neighbors' weighted
+        by inverse distance.
+    """
+    from sklearn.neighbors import NearestNeighbors
+    k = min(k, fit.shape[0])
+    nn = NearestNeighbors(n_neighbors=k, n_jobs=n_jobs).fit(fit)
+    distances, indices = nn.kneighbors(rest)
+    weights = 1 / np.maximum(distances, 1e-12)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum('ij,ijk->ik', weights, res[indices])
+
+
+def sample_rows(lengths, min_length, size, seed=None):
+    """Sample rows with a preference for long sequences.
+
+    Parameters
+    ----------
+    lengths : np.ndarray
+        Sequence lengths.
+    min_length : int
+        Minimum length for a sequence to be always included.
+    size : int
+        Maximum number of shorter sequences to include.
+    seed : int, optional
+        Random seed.
+
+    Returns
+    -------
+    np.ndarray of bool
+        Sampled rows.
+
+    Notes
+    -----
+    Shorter sequences are sampled without replacement, with probabilities
+    proportional to their lengths.
+    """
+    lengths = np.asarray(lengths, dtype=np.float64)
+    mask = lengths >= min_length
+    rest = np.flatnonzero(~mask)
+    if rest.shape[0] <= size:
+        mask[:] = True
+        return mask
+    p = lengths[rest] + 1
+    rng = np.random.default_rng(seed)
+    mask[rng.choice(rest, size=size, replace=False, p=p / p.sum())] = True
+    return mask
+
+
+def read_lengths(fp, ids):
+    """Read sequence lengths from a table.
+
+    Parameters
+    ----------
+    fp : str
+        Tab-separated table of sequence identifiers and lengths, such as
+        the output of sequence_basics.py (with a "length" column), or a
+        two-column table.
+    ids : pd.Index
+        Sample identifiers.
+
+    Returns
+    -------
+    np.ndarray
+        Sequence lengths of samples (zero if absent).
+    """
+    df = pd.read_table(fp, index_col=0)
+    col = 'length' if 'length' in df.columns else df.columns[0]
+    return df[col].reindex(ids.astype(str)).fillna(0).values
+
+
+def row_digests(ids, data):
+    """Calculate a hash digest of each row of a data table.
+
+    Parameters
+    ----------
+    ids : pd.Index
+        Sample identifiers.
+    data : np.ndarray
+        Data table.
+
+    Returns
+    -------
+    np.ndarray of uint64
+        Digests of identifiers and values of rows.
+    """
+    return np.array([int.from_bytes(blake2b(f'{x}\t'.encode() + row.tobytes(
+        ), digest_size=8).digest(), 'little') for x, row in zip(
+            ids, data)], dtype=np.uint64)
+
+
+def model_params(args):
+    """Parameters that saved models must match.
+    """
+    return {'ndim': args.ndim, 'pseudocount': args.pseudocount,
+            'features': args.features, 'double': args.double}
+
+
+def load_model(output, ncol, args):
+    """Load saved models if applicable.
+
+    Parameters
+    ----------
+    output : str
+        Output filepath stem.
+    ncol : int
+        Number of features of data.
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    dict or None
+        Saved models and results, or None if not found or not applicable.
+    """
+    fp = f'{output}.model.pkl'
+    if not os.path.isfile(fp):
+        return
+    with open(fp, 'rb') as f:
+        model = pickle.load(f)
+    if model['params'] != model_params(args) or model['ncol'] != ncol:
+        print(f'Saved models in {fp} do not match parameters.')
+        return
+    for method in ('pca', 'tsne', 'umap'):
+        if getattr(args, method) and method not in model['res']:
+            print(f'Saved models in {fp} do not include {NAMES[method]}.')
+            return
+    return model
+
+
+def save_model(output, ids, state, args):
+    """Save fitted models and results.
+
+    Parameters
+    ----------
+    output : str
+        Output filepath stem.
+    ids : pd.Index
+        Sample identifiers.
+    state : dict
+        Fitted models and results, including digests of rows, number of
+        features, PCA model, feature extraction model, UMAP model, data for
+        embedding, and embeddings.
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Notes
+    -----
+    Data for embedding (transformed or extracted features) is saved only if
+    t-SNE was performed, as 32-bit floats, since it is only needed to project
+    new rows onto the t-SNE embedding.
+    """
+    # data for embedding is only needed to project new rows onto t-SNE
+    data = state.get('data')
+    if data is not None:
+        data = data.astype(np.float32, copy=False) if 'tsne' in state[
+            'res'] else None
+    model = dict(state, data=data, ids=list(ids), params=model_params(args),
+                 hash=blake2b(state['digests'].tobytes()).hexdigest())
+    with open(f'{output}.model.pkl', 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def reuse_model(model, ids, data, digests, output, prefix, args):
+    """Reuse saved models and results, and transform new rows only.
+
+    Parameters
+    ----------
+    model : dict
+        Saved models and results.
+    ids : pd.Index
+        Sample identifiers.
+    data : np.ndarray
+        Original data table.
+    digests : np.ndarray
+        Digests of rows.
+    output : str
+        Output filepath stem.
+    prefix : str or None
+        Prefix of output column names.
+    args : argparse.Namespace
+        Command-line arguments.
+    """
+    # match rows to saved ones
+    n = data.shape[0]
+    if blake2b(digests.tobytes()).hexdigest() == model['hash']:
+        old = np.arange(n)
+    else:
+        pos = {x: i for i, x in enumerate(model['digests'].tolist())}
+        old = np.array([pos.get(x, -1) for x in digests.tolist()], dtype=int)
+    new = old < 0
+    known, nnew = ~new, int(new.sum())
+    print(f'Reuse saved models of {output} for {n - nnew} samples, and '
+          f'transform {nnew} new samples.')
+
+    # transform new rows
+    sub, feats, fit = None, None, model['data']
+    if nnew:
+        sub = data[new]
+        add_pseudocount(sub, args.pseudocount, args.chunksize)
+        clr(sub, args.chunksize)
+        feats = sub if model['features'] is None else model[
+            'features'].transform(sub).astype(sub.dtype)
+    if fit is not None:
+        data_ = np.empty((n, fit.shape[1]), dtype=fit.dtype)
+        data_[known] = fit[old[known]]
+        if nnew:
+            data_[new] = feats
+
+    # combine results
+    res = {}
+    for method in ('pca', 'tsne', 'umap'):
+        if method not in model['res']:
+            continue
+        saved = model['res'][method]
+        res_ = np.empty((n, saved.shape[1]), dtype=saved.dtype)
+        res_[known] = saved[old[known]]
+        if nnew:
+            if method == 'pca':
+                res_[new] = model['pca'].transform(sub)
+            elif method == 'umap':
+                res_[new] = model['umap'].transform(feats)
+            else:
+                res_[new] = project(fit, saved, feats)
+        res[method] = res_
+        if getattr(args, method):
+            write_embedding(res_, ids, method, output, prefix, args.store)
+
+    # save updated models
+    if nnew or n < model['digests'].shape[0]:
+        save_model(output, ids, dict(model, digests=digests, res=res, data=(
+            None if fit is None else data_)), args)
+
+
+def tsne_engine(n, args):
+    """Choose t-SNE engine given sample size.
+
+    Parameters
+    ----------
+    n : int
+        Number of samples.
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    str
+        "sklearn", "bh" or "fft".
+    """
+    engine = args.tsne_engine
+    if engine != 'auto':
+        return engine
+    if n < args.tsne_large:
+        return 'sklearn'
+    try:
+        import openTSNE  # noqa: F401
+    except ModuleNotFoundError:
+        return 'bh'
+    return 'fft'
+
+
+def perplexity(n, engine='sklearn'):
+    """Perplexity of t-SNE given sample size.
+
+    Parameters
+    ----------
+    n : int
+        Number of samples.
+    engine : str, optional
+        t-SNE engine.
+
+    Returns
+    -------
+    float
+        Perplexity.
+
+    Notes
+    -----
+    The default engine uses a fixed perplexity of 2, such that results are
+    computed as in earlier versions. The other engines use 1% of sample size,
+    bounded between 5 and 50, which has been suggested for large datasets.
+    """
+    if engine == 'sklearn':
+        return min(2, n - 1)  # Ensure perplexity < n_samples
+    return max(1, min(max(5, n / 100), 50, (n - 2) / 3))
+
+
+def knn_graph(data, k, seed=None, n_jobs=None):
+    """Build an approximate k-nearest neighbor graph.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Data table.
+    k : int
+        Number of neighbors (including self).
+    seed : int, optional
+        Random seed.
+    n_jobs : int, optional
+        Number of threads.
+
+    Returns
+    -------
+    np.ndarray of shape (n, k)
+        Indices of neighbors of each sample, ordered by distance.
+    np.ndarray of shape (n, k)
+        Euclidean distances to neighbors.
+    pynndescent.NNDescent or None
+        Search index, if built using NN-descent.
+
+    Notes
+    -----
+    The graph is built using NN-descent (Python library pynndescent, which
+    comes with umap-learn) if available, otherwise by an exact search using
+    scikit-learn.
+    """
+    try:
+        from pynndescent import NNDescent
+    except ModuleNotFoundError:
+        from sklearn.neighbors import NearestNeighbors
+        nn = NearestNeighbors(n_neighbors=k, n_jobs=n_jobs).fit(data)
+        distances, indices = nn.kneighbors(data)
+        return indices, distances, None
+    index = NNDescent(data, n_neighbors=k, random_state=seed, n_jobs=n_jobs)
+    return (*index.neighbor_graph, index)
+
+
+def knn_sparse(indices, distances):
+    """Convert a k-nearest neighbor graph into a sparse matrix of squared
+    distances, as input for t-SNE.
+
+    Parameters
+    ----------
+    indices : np.ndarray of shape (n, k)
+        Indices of neighbors of each sample, including self.
+    distances : np.ndarray of shape (n, k)
+        Distances to neighbors.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix of shape (n, n)
+        Squared distances to neighbors.
+
+    Notes
+    -----
+    As with `sklearn.neighbors.KNeighborsTransformer`, each sample is stored
+    as its own neighbor (with an explicit zero), which is excluded by t-SNE.
+    """
+    from scipy.sparse import csr_matrix
+    n, k = indices.shape
+    return csr_matrix((np.square(distances).ravel(), indices.ravel(),
+                       np.arange(0, n * k + 1, k)), shape=(n, n))
+
+
+def write_embedding(res, ids, method, output, prefix=None, store=None):
+    """Write embedding to a tab-separated file, and optionally to a feature
+    store.
+
+    Parameters
+    ----------
+    res : np.ndarray
+        Embedding.
+    ids : pd.Index
+        Sample identifiers.
+    method : {'pca', 'tsne', 'umap'}
+        Embedding method.
+    output : str
+        Output filepath stem.
+    prefix : str, optional
+        Prefix of column names (e.g., k-mer size). If provided, columns are
+        named like "4PC1", "4tsne1" and "4UM1", and the index is named "ID".
+    store : str, optional
+        Feature store directory. The embedding is written as column group
+        named by method and prefix (e.g., "umap4").
+    """
+    df = pd.DataFrame(res, index=ids, columns=column_names(
+        method, res.shape[1], prefix))
+    if prefix is not None:
+        df.index.name = 'ID'
+    df.to_csv(f'{output}.{method}.tsv', sep='\t')
+    if store:
+        from feature_store import write_group
+        write_group(store, f'{method}{prefix or ""}', df)
+
+
+def column_names(method, ndim, prefix=None):
+    """Generate column names of an embedding.
+
+    Parameters
+    ----------
+    method : {'pca', 'tsne', 'umap'}
+        Embedding method.
+    ndim : int
+        Number of dimensions.
+    prefix : str, optional
+        Prefix of column names.
+
+    Returns
+    -------
+    list of str
+        Column names.
+    """
+    if prefix is None:
+        return [f'{COLUMNS[method][0]}{i + 1}' for i in range(ndim)]
+    return [f'{prefix}{COLUMNS[method][1]}{i + 1}' for i in range(ndim)]
+
+
+def incremental(fp, output, prefix, args):
+    """Perform PCA and feature extraction by streaming data from file.
+
+    Parameters
+    ----------
+    fp : str
+        Input file path.
+    output : str
+        Output filepath stem.
+    prefix : str or None
+        Prefix of output column names.
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    pd.Index
+        Sample identifiers.
+    np.ndarray or None
+        Extracted features for t-SNE and UMAP.
+    int
+        Number of features of original data.
+    int
+        Number of rows to which pseudocount was added.
+    np.ndarray
+        Row sums of original data.
+    """
+    dtype = np.float64 if args.double else np.float32
+    chunk = args.chunksize
+    chunks = iter_chunks(fp, dtype, 1)
+    ncol = next(chunks)[1].shape[1]
+    chunks.close()
+
+    # models: PCA output, and/or feature extraction if there are >200 features
+    ncomps = []
+    if args.pca:
+        ncomps.append(args.ndim)
+    embed = args.tsne or args.umap
+    if embed and ncol > 200:
+        ncomps.append(min(args.features, ncol, chunk))
+    if not ncomps:
+        with open(fp) as f:
+            ids, data = read_data(f, dtype, chunk)
+        sums = data.sum(axis=1)
+        npseudo = add_pseudocount(data, args.pseudocount, chunk)
+        clr(data, chunk)
+        return ids, data, ncol, npseudo, sums
+
+    print(f'Performing incremental PCA of {fp}...')
+    ids, models, res, npseudo, sums = incremental_pca(
+        fp, ncomps, args.pseudocount, dtype, chunk)
+    print('Done.')
+    data = None
+    if args.pca:
+        print(f'Loadings: {models[0].explained_variance_ratio_}')
+        write_embedding(res[0], ids, 'pca', output, prefix, args.store)
+        if embed and ncol <= 200:
+            with open(fp) as f:
+                ids, data = read_data(f, dtype, chunk)
+            add_pseudocount(data, args.pseudocount, chunk)
+            clr(data, chunk)
+    if embed and ncol > 200:
+        data = res[-1]
+    return ids, data, ncol, npseudo, sums
+
+
+def read_data(f, dtype=np.float64, chunksize=10000):
+    """Read input data table.
+
+    Parameters
+    ----------
+    f : file handle
+        Input file, either a tab-separated table or a binary k-mer matrix.
+    dtype : np.dtype, optional
+        Data type of result.
+    chunksize : int, optional
+        Number of rows per chunk when parsing a tab-separated table.
+
+    Returns
+    -------
+    pd.Index
+        Sample identifiers.
+    np.ndarray
+        Data table.
+
+    Notes
+    -----
+    A table in a regular file is scanned once to count rows, such that chunks
+    are parsed into a preallocated array and only one copy of the data is
+    held. A table from a pipe cannot be scanned twice, and its chunks are
+    concatenated at the end, which briefly holds two copies.
+    """
+    if f is sys.stdin:
+        stdin = sys.stdin.buffer
+        head = b''
+        while len(head) < len(MAGIC):
+            buf = stdin.read1(len(MAGIC) - len(head))
+            if not buf:
+                break
+            head += buf
+        if head == MAGIC:
+            buf = bytearray(head)
+            for block in iter(lambda: stdin.read1(1 << 20), b''):
+                buf += block
+            ids, _, data = read_matrix_bytes(buf)
+            return pd.Index(ids), data.astype(dtype, copy=False)
+        f = io.TextIOWrapper(io.BufferedReader(Prepended(head, stdin)))
+    elif is_matrix(f.name):
+        ids, _, data = read_matrix(f.name)
+        res = np.empty(data.shape, dtype=dtype)
+        for i in range(0, data.shape[0], chunksize):
+            res[i:i + chunksize] = data[i:i + chunksize]
+        return pd.Index(ids), res
+
+    # count rows (lines after the header) of a regular file
+    nrow = None
+    if f.seekable():
+        nrow, last = -1, b'\n'
+        for block in iter(lambda: f.buffer.read(1 << 20), b''):
+            nrow += block.count(b'\n')
+            last = block[-1:]
+        nrow = max(nrow + (last != b'\n'), 0)
+        f.seek(0)
+
+    ids, chunks, res, n = [], [], None, 0
+    for index, values in iter_table(f, dtype, chunksize):
+        ids.append(index)
+        if nrow is None:
+            chunks.append(values)
+            continue
+        if res is None:
+            res = np.empty((nrow, values.shape[1]), dtype=dtype)
+        if n + values.shape[0] > nrow:
+            res = np.concatenate([res[:n], values])
+            nrow = res.shape[0]
+        else:
+            res[n:n + values.shape[0]] = values
+        n += values.shape[0]
+    if res is not None:
+        data = res if n == nrow else res[:n]
+    else:
+        data = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+    return ids[0].append(ids[1:]), data
+
+
+class Prepended(io.RawIOBase):
+    """Readable stream of bytes already read, followed by the rest of a
+    stream.
+
+    Parameters
+    ----------
+    head : bytes
+        Bytes already read.
+    stream : file handle
+        Binary stream.
+    """
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.head:
+            n = min(len(b), len(self.head))
+            b[:n], self.head = self.head[:n], self.head[n:]
+            return n
+        buf = self.stream.read1(len(b))
+        b[:len(buf)] = buf
+        return len(buf)
+
+
+def iter_table(f, dtype=np.float64, chunksize=10000):
+    """Parse a tab-separated data table in chunks of rows.
+
+    Parameters
+    ----------
+    f : file handle
+        Input tab-separated table.
+    dtype : np.dtype, optional
+        Data type of result.
+    chunksize : int, optional
+        Number of rows per chunk.
+
+    Yields
+    ------
+    pd.Index
+        Sample identifiers of chunk.
+    np.ndarray
+        Data of chunk.
+
+    Notes
+    -----
+    At least one (possibly empty) chunk is yielded.
+    """
+    header = f.readline().rstrip('\r\n').split('\t')
+    name, ncol = header[0] or None, len(header) - 1
+    empty = True
+    for df in pd.read_table(f, header=None, index_col=0, chunksize=chunksize,
+                            names=range(ncol + 1), dtype={
+                                i + 1: dtype for i in range(ncol)}):
+        empty = False
+        yield df.index.rename(name), df.values
+    if empty:
+        yield pd.Index([], name=name), np.empty((0, ncol), dtype)
+
+
+def iter_chunks(fp, dtype=np.float64, chunksize=10000):
+    """Read a data table file in chunks of rows.
+
+    Parameters
+    ----------
+    fp : str
+        Input file path, either a tab-separated table or a binary k-mer
+        matrix.
+    dtype : np.dtype, optional
+        Data type of result.
+    chunksize : int, optional
+        Number of rows per chunk.
+
+    Yields
+    ------
+    pd.Index
+        Sample identifiers of chunk.
+    np.ndarray
+        Data of chunk (a new array that can be modified in place).
+    """
+    if is_matrix(fp):
+        ids, _, data = read_matrix(fp)
+        for i in range(0, data.shape[0], chunksize):
+            yield pd.Index(ids[i:i + chunksize]), np.array(
+                data[i:i + chunksize], dtype=dtype)
+        return
+    with open(fp) as f:
+        yield from iter_table(f, dtype, chunksize)
+
+
+def incremental_pca(fp, ncomps, pseudo=1.0, dtype=np.float64,
+                    chunksize=10000):
+    """Perform PCA on a data table file in chunks of rows.
+
+    Parameters
+    ----------
+    fp : str
+        Input file path.
+    ncomps : list of int
+        Numbers of components of each PCA model.
+    pseudo : float, optional
+        Pseudocount.
+    dtype : np.dtype, optional
+        Data type of data.
+    chunksize : int, optional
+        Number of rows per chunk.
+
+    Returns
+    -------
+    pd.Index
+        Sample identifiers.
+    list of sklearn.decomposition.IncrementalPCA
+        Fitted PCA models.
+    list of np.ndarray
+        Transformed data of each model.
+    int
+        Number of rows to which pseudocount was added.
+    np.ndarray
+        Row sums of original data.
+
+    Raises
+    ------
+    InputError
+        If there are fewer samples than components.
+
+    Notes
+    -----
+    The file is read twice: first to fit the models, then to transform the
+    data. Only one chunk of data and the transformed data are held in memory.
+    The data are CLR-transformed chunk by chunk.
+
+    Each model needs at least as many rows per partial fit as components. A
+    short chunk is therefore merged into the previous one before fitting.
+    """
+    def chunks():
+        for index, data in iter_chunks(fp, dtype, chunksize):
+            nonlocal npseudo
+            sums.append(data.sum(axis=1))
+            npseudo += add_pseudocount(data, pseudo, chunksize)
+            clr(data, chunksize)
+            yield index, data
+
+    # fit models, holding back one chunk in case the next one is too short
+    models = [IncrementalPCA(n_components=n) for n in ncomps]
+    need = max(ncomps)
+    npseudo, sums, held = 0, [], None
+    for _, data in chunks():
+        if held is None:
+            held = data
+        elif data.shape[0] >= need:
+            for model in models:
+                model.partial_fit(held)
+            held = data
+        else:
+            held = np.concatenate([held, data])
+    if held is None or held.shape[0] < need:
+        raise InputError(f'At least {need} samples are required.')
+    for model in models:
+        model.partial_fit(held)
+    del held
+
+    # transform data chunk by chunk
+    npseudo, sums, ids, res = 0, [], [], [[] for _ in models]
+    for index, data in chunks():
+        ids.append(index)
+        for model, lst in zip(models, res):
+            lst.append(model.transform(data))
+    ids = ids[0].append(ids[1:])
+    return (ids, models, [np.concatenate(x) for x in res], npseudo,
+            np.concatenate(sums))
+
+
+def add_pseudocount(data, pseudo, chunksize=10000):
+    """Add a pseudocount to rows that have zeros, in place.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Data table.
+    pseudo : float
+        Pseudocount.
+    chunksize : int, optional
+        Number of rows per chunk.
+
+    Returns
+    -------
+    int
+        Number of rows to which pseudocount was added.
+    """
+    res = 0
+    for i in range(0, data.shape[0], chunksize):
+        chunk = data[i:i + chunksize]
+        mask = (chunk == 0).any(axis=1)
+        chunk[mask] += pseudo
+        res += int(mask.sum())
+    return res
+
+
+def clr(data, chunksize=10000):
+    """Perform centered log-ratio transform on rows, in place.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Data table (without zeros).
+    chunksize : int, optional
+        Number of rows per chunk.
+    """
+    for i in range(0, data.shape[0], chunksize):
+        chunk = data[i:i + chunksize]
+        np.log(chunk, out=chunk)
+        chunk -= chunk.mean(axis=-1, keepdims=True)
+
+
+def peak_memory():
+    """Get peak resident set size (RSS) of the current process, or of any
+    child process if larger.
+
+    Returns
+    -------
+    float
+        Peak RSS in MB.
+    """
+    res = max(resource.getrusage(x).ru_maxrss for x in (
+        resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    return res / 1024 ** 2 if sys.platform == 'darwin' else res / 1024
+
+
+class Tests(unittest.TestCase):
+    def test_sample_rows(self):
+        lengths = np.array([5000, 100, 200, 3000, 300, 400])
+        obs = sample_rows(lengths, 2500, 2, seed=42)
+        self.assertTrue(obs[0] and obs[3])
+        self.assertEqual(obs.sum(), 4)
+        obs = sample_rows(lengths, 2500, 4)
+        self.assertTrue(obs.all())
+
+    def test_kmer_lengths(self):
+        sums = np.array([50.0, 0.0])
+        self.assertListEqual(kmer_lengths(sums, 256).tolist(), [28, 3])
+        self.assertListEqual(kmer_lengths(sums, 136).tolist(), [50 / (
+            1 + 1 / 16) + 3, 3])
+        self.assertListEqual(kmer_lengths(sums, 512).tolist(), [54, 4])
+        self.assertListEqual(kmer_lengths(sums, 100).tolist(), [50, 0])
+
+    def test_read_data(self):
+        import tempfile
+        from shutil import rmtree
+        from unittest import mock
+        from kmer_matrix import write_matrix
+        exp = np.arange(15, dtype=np.float64).reshape(5, 3)
+        ids = [f'c{i}' for i in range(5)]
+        text = 'ID\ta\tb\tc\n' + ''.join(f'{x}\t' + '\t'.join(
+            map(str, y)) + '\n' for x, y in zip(ids, exp.astype(int)))
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fp = os.path.join(tmpdir, 'in.tsv')
+            with open(fp, 'w') as f:
+                f.write(text)
+            with open(fp) as f:
+                obs = read_data(f, chunksize=2)
+            self.assertListEqual(obs[0].tolist(), ids)
+            self.assertListEqual(obs[1].tolist(), exp.tolist())
+
+            # piped table and binary matrix
+            fp = os.path.join(tmpdir, 'in.bin')
+            write_matrix(fp, ids, list('abc'), exp, dtype='<f8')
+            with open(fp, 'rb') as f:
+                buf = f.read()
+            for content in (text.encode(), buf):
+                stdin = io.TextIOWrapper(io.BytesIO(content))
+                with mock.patch('sys.stdin', new=stdin):
+                    obs = read_data(stdin, chunksize=2)
+                self.assertListEqual(obs[0].tolist(), ids)
+                self.assertListEqual(obs[1].tolist(), exp.tolist())
+        finally:
+            rmtree(tmpdir)
+
+    def test_project(self):
+        fit = np.array([[0.0], [1.0], [10.0]])
+        res = np.array([[0.0, 0.0], [2.0, 2.0], [5.0, 5.0]])
+        obs = project(fit, res, np.array([[0.5], [10.0]]), k=2)
+        self.assertListEqual(obs.round(6).tolist(), [[1.0, 1.0], [5.0, 5.0]])
+
+    def test_column_names(self):
+        self.assertListEqual(column_names('pca', 2), ['PC1', 'PC2'])
+        self.assertListEqual(column_names('tsne', 2, '4'),
+                             ['4tsne1', '4tsne2'])
+        self.assertListEqual(column_names('umap', 1, '5'), ['5UM1'])
+
+    def test_reuse_model(self):
+        import tempfile
+        from shutil import rmtree
+        from unittest import mock
+        tmpdir = tempfile.mkdtemp()
+        fp, out = os.path.join(tmpdir, 'in.tsv'), os.path.join(tmpdir, 'out')
+        rng = np.random.default_rng(42)
+        pd.DataFrame(rng.poisson(5, (30, 256)), index=[
+            f'c{i}' for i in range(30)]).to_csv(fp, sep='\t')
+        argv = ['me.py', '-i', fp, '-o', out, '--pca', '--tsne', '-m', '-f',
+                '5', '-s', '42']
+        obs = []
+        try:
+            for _ in range(2):
+                with mock.patch('sys.argv', argv), mock.patch(
+                        'sys.stdout', new=io.StringIO()):
+                    main()
+                obs.append([pd.read_table(f'{out}.{x}.tsv', index_col=0)
+                            for x in ('pca', 'tsne')])
+            with open(f'{out}.model.pkl', 'rb') as f:
+                model = pickle.load(f)
+        finally:
+            rmtree(tmpdir)
+        for x, y in zip(*obs):
+            self.assertTrue(x.equals(y))
+        self.assertTupleEqual(model['data'].shape, (30, 5))
+        self.assertEqual(model['data'].dtype, np.float32)
+
+    def test_knn_sparse(self):
+        data = np.array([[0.0], [1.0], [3.0], [3.0]])
+        indices, distances, _ = knn_graph(data, 3)
+        obs = knn_sparse(indices, distances)
+        self.assertTupleEqual(obs.shape, (4, 4))
+        self.assertListEqual(obs.getnnz(axis=1).tolist(), [3, 3, 3, 3])
+        self.assertListEqual(obs.diagonal().tolist(), [0, 0, 0, 0])
+        self.assertEqual(obs[0, 1], 1)
+        self.assertEqual(obs[1, 0], 1)
+        self.assertEqual(obs[2, 3], 0)
+        self.assertEqual(obs[1, 2], 4)
 
 
 if __name__ == "__main__":
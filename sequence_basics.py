@@ -3,6 +3,7 @@
 
 Examples:
     python me.py -i input.fna -o output.tsv
+    python me.py -i input.fna -o output.tsv -S summary.json
     python me.py -i final.contigs.fa -a megahit -o output.tsv
     python me.py -i scaffolds.fasta -a spades --trim -o output.tsv
     zcat input.fna.gz | python me.py -l 1000 | gzip > output.tsv.gz
@@ -11,14 +12,33 @@ Notes:
     Length and GC content are calculated from the actual sequences. Code
     degeneracy is considered when counting GC.
 
+    In streaming mode, length and GC are accumulated line by line, such that
+    long sequences (e.g., chromosomes) are never held in memory as a whole.
+
     Coverage is taken from assembler-specific sequence titles (if applicable).
     However, note that these are not precise coverage values, and they are
     likely not identical to the results calculated from read mappings.
+
+    Optionally, a JSON summary of the assembly is written, including number
+    of sequences, total length, N50/N90, L50/L90, overall GC%, GC distribution
+    (1% bins) and a log-binned (1-2-5 series) length histogram. It is computed
+    in the same pass as the table, from counts of distinct lengths and GC
+    bins, instead of a sorted list of all sequence lengths.
+
+    Optionally, the table is also written as column group "basic" of a feature
+    store (see feature_store.py), which requires pandas and pyarrow.
 """
 
 import re
 import sys
+import json
 import argparse
+import unittest
+from math import ceil
+from bisect import bisect_right
+from collections import Counter
+
+from fasta_reader import read_fasta, read_fasta_lines
 
 
 # SPAdes sequence title
@@ -29,6 +49,16 @@ spades = re.compile(r'^(NODE_\d+)_length_(\d+)_cov_(\d*\.?\d*)$')
 # e.g. k141_1 flag=1 multi=5.0000 len=1000
 megahit = re.compile(r'^(k\d+_\d+)\sflag=\d+\smulti=(\d*\.?\d*)\slen=(\d+)$')
 
+# GC weights (out of 6) of nucleotide codes
+gc_codes = {6: 'GCS', 3: 'RYKMN', 2: 'DH', 4: 'BV'}
+
+# translation table of characters (both cases) into GC weights (0 for others)
+gc_table = bytearray(256)
+for w, codes in gc_codes.items():
+    for c in codes + codes.lower():
+        gc_table[ord(c)] = w
+gc_table = bytes(gc_table)
+
 
 def parse_args():
     """Command-line interface.
@@ -36,17 +66,25 @@ def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter)
     arg = parser.add_argument
-    arg('-i', '--input', type=argparse.FileType('r'), default=sys.stdin,
-        help='input multi-FASTA file, default: stdin')
+    arg('-i', '--input', type=argparse.FileType('rb'), default=sys.stdin,
+        help='input multi-FASTA file (may be gzipped), default: stdin')
+    arg('--mmap', action='store_true',
+        help='memory-map input file (if plain)')
     arg('-l', '--minlen', type=int,
         help='minimum length threshold')
     arg('-a', '--assembler', type=str, default='auto',
         choices=['auto', 'spades', 'megahit', 'none'],
         help='parse assembler-specific titles')
+    arg('-s', '--stream', action='store_true',
+        help='accumulate length and GC line by line')
     arg('-t', '--trim', action='store_true',
         help='trim SPAdes titles into NODE_#')
     arg('-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
         help='output table file, default: stdout')
+    arg('-S', '--summary', type=argparse.FileType('w'),
+        help='output assembly summary (JSON) file')
+    arg('--store', type=str,
+        help='also write table to feature store directory')
     for arg in parser._actions:
         arg.metavar = ''
     if len(sys.argv) == 1:
@@ -63,22 +101,24 @@ def main():
     assem = args.assembler
     trim = args.trim
     head = False
-    title = None
-    seq = ''
+    stats = AssemblyStats() if args.summary else None
+    rows = [] if args.store else None
 
-    def parse_seq():
-        if not seq:
+    def parse_seq(title, L, gc):
+        if not L:
             return
-        L = len(seq)
         if minlen and L < minlen:
             return
-        gc = '{:.2f}'.format(count_gc(seq) * 100 / L)
-        nonlocal title
+        if stats:
+            stats.add(L, gc)
+        gc = '{:.2f}'.format(gc * 100 / L)
         nonlocal head
         try:
             name, cov = parse_title(title, assem, trim)
         except ValueError as e:
             exit(e)
+        if rows is not None:
+            rows.append((name, L, float(gc), float(cov) if cov else None))
         if cov:
             if not head:
                 print('ID', 'length', 'GC', 'coverage', sep='\t', file=out)
@@ -90,14 +130,49 @@ def main():
                 head = True
             print(name, L, gc, sep='\t', file=out)
 
-    for line in args.input:
-        line = line.rstrip()
-        if line.startswith('>'):
-            parse_seq()
-            title, seq = line[1:], ''
-        else:
-            seq += line.upper()
-    parse_seq()
+    if not args.stream:
+        for title, seq in read_fasta(args.input, args.mmap):
+            parse_seq(title, len(seq), count_gc(seq))
+    else:
+        title, L, gc = None, 0, 0
+        for line_title, line in read_fasta_lines(args.input):
+            if line_title is not None:
+                if title is not None:
+                    parse_seq(title, L, gc)
+                title, L, gc = line_title, 0, 0
+            else:
+                L += len(line)
+                gc += count_gc(line)
+        if title is not None:
+            parse_seq(title, L, gc)
+
+    if rows is not None:
+        write_store(args.store, rows)
+
+    if stats:
+        json.dump(stats.summary(), args.summary)
+        args.summary.write('\n')
+        args.summary.close()
+
+
+def write_store(store, rows):
+    """Write length, GC% and coverage as column group "basic" of a feature
+    store.
+
+    Parameters
+    ----------
+    store : str
+        Feature store directory.
+    rows : list of tuple
+        Identifier, length, GC% and coverage (or None) of each sequence.
+    """
+    import pandas as pd
+    from feature_store import write_group
+    df = pd.DataFrame(rows, columns=['ID', 'length', 'GC', 'coverage'])
+    df = df.set_index('ID')
+    if df['coverage'].isna().all():
+        df = df.drop(columns='coverage')
+    write_group(store, 'basic', df)
 
 
 def count_gc(seq):
@@ -105,7 +180,7 @@ def count_gc(seq):
 
     Parameters
     ----------
-    seq : str
+    seq : str or bytes
         DNA sequence.
 
     Returns
@@ -115,19 +190,135 @@ def count_gc(seq):
 
     Notes
     ----
-    Code degeneracy is considered.
+    Code degeneracy is considered. Each character is translated into its GC
+    weight class, which are then counted in one go.
     """
-    res = 0
-    for c in seq.upper():
-        if c in 'GCS':
-            res += 6
-        elif c in 'RYKMN':
-            res += 3
-        elif c in 'DH':
-            res += 2
-        elif c in 'BV':
-            res += 4
-    return res / 6
+    if isinstance(seq, str):
+        seq = seq.encode()
+    seq = seq.translate(gc_table)
+    return sum(seq.count(w) * w for w in gc_codes) / 6
+
+
+class AssemblyStats:
+    """Accumulate summary statistics of an assembly sequence by sequence.
+
+    Notes
+    -----
+    Only the number of sequences per distinct length and per GC bin are kept,
+    therefore memory usage is bounded by the range of sequence lengths rather
+    than the number of sequences, whereas N50 etc. remain exact.
+    """
+    def __init__(self):
+        self.lengths = Counter()
+        self.gcs = Counter()
+        self.gc_bases = Counter()
+        self.gc = 0
+
+    def add(self, L, gc):
+        """Add a sequence.
+
+        Parameters
+        ----------
+        L : int
+            Sequence length.
+        gc : float
+            GC count of the sequence.
+        """
+        self.lengths[L] += 1
+        self.gc += gc
+        x = min(int(gc * 100 / L), 99)
+        self.gcs[x] += 1
+        self.gc_bases[x] += L
+
+    def summary(self):
+        """Summarize the assembly.
+
+        Returns
+        -------
+        dict
+            Summary statistics.
+        """
+        n = sum(self.lengths.values())
+        total = sum(L * c for L, c in self.lengths.items())
+        res = {'sequences': n, 'total_length': total}
+        if not n:
+            return res
+        res['min_length'] = min(self.lengths)
+        res['max_length'] = max(self.lengths)
+        res['mean_length'] = round(total / n, 2)
+        for x in (50, 90):
+            res[f'N{x}'], res[f'L{x}'] = nx(self.lengths, total, x)
+        res['GC'] = round(self.gc * 100 / total, 2)
+
+        # GC distribution (1% bins)
+        res['GC_distribution'] = {
+            'bins': sorted(self.gcs),
+            'sequences': [self.gcs[x] for x in sorted(self.gcs)],
+            'bases': [self.gc_bases[x] for x in sorted(self.gcs)]}
+
+        # length histogram (log bins)
+        edges = log_bins(res['max_length'])
+        counts, bases = [0] * len(edges), [0] * len(edges)
+        for L, c in self.lengths.items():
+            i = bisect_right(edges, L) - 1
+            counts[i] += c
+            bases[i] += L * c
+        first = next(i for i, x in enumerate(counts) if x)
+        res['length_histogram'] = {
+            'bins': edges[first:], 'sequences': counts[first:],
+            'bases': bases[first:]}
+        return res
+
+
+def nx(lengths, total, x):
+    """Calculate Nx and Lx of an assembly.
+
+    Parameters
+    ----------
+    lengths : dict of int
+        Number of sequences per length.
+    total : int
+        Total length.
+    x : int
+        Percentage of total length.
+
+    Returns
+    -------
+    int
+        Nx: length of the shortest sequence among the longest sequences that
+        cover x% of total length.
+    int
+        Lx: minimum number of sequences that cover x% of total length.
+    """
+    target = total * x / 100
+    cum, num = 0, 0
+    for L in sorted(lengths, reverse=True):
+        c = lengths[L]
+        if cum + L * c >= target:
+            return L, num + max(ceil((target - cum) / L), 1)
+        cum += L * c
+        num += c
+    return L, num
+
+
+def log_bins(maximum):
+    """Generate lower edges of logarithmic bins (1-2-5 series).
+
+    Parameters
+    ----------
+    maximum : int
+        Maximum value to cover.
+
+    Returns
+    -------
+    list of int
+        Lower edges of bins.
+    """
+    res, x = [], 1
+    while x <= maximum:
+        res.extend(y for y in (x, 2 * x, 5 * x) if y <= maximum)
+        x *= 10
+    return res
 
 
 def parse_title(title, assem, trim=False):
@@ -188,5 +379,58 @@ def parse_title(title, assem, trim=False):
     return name, cov
 
 
+class Tests(unittest.TestCase):
+    def test_count_gc(self):
+        def baseline(seq):
+            res = 0
+            for c in seq.upper():
+                if c in 'GCS':
+                    res += 6
+                elif c in 'RYKMN':
+                    res += 3
+                elif c in 'DH':
+                    res += 2
+                elif c in 'BV':
+                    res += 4
+            return res / 6
+
+        for seq in ('ACGTacgtNNNnnn', 'GgCcSsRrYyKkMmDdHhBbVvWw-*', 'atat',
+                    'NNNNNNNNNNgcGC', ''):
+            self.assertEqual(count_gc(seq), baseline(seq))
+            self.assertEqual(count_gc(seq.encode()), baseline(seq))
+        self.assertEqual(count_gc('ACGTacgtNN'), 5.0)
+
+    def test_nx(self):
+        lengths = Counter({1000: 1, 500: 1, 200: 2, 100: 1})
+        self.assertTupleEqual(nx(lengths, 2000, 50), (1000, 1))
+        self.assertTupleEqual(nx(lengths, 2000, 90), (200, 4))
+        self.assertTupleEqual(nx(lengths, 2000, 100), (100, 5))
+
+    def test_log_bins(self):
+        self.assertListEqual(log_bins(0), [])
+        self.assertListEqual(log_bins(1), [1])
+        self.assertListEqual(log_bins(150), [1, 2, 5, 10, 20, 50, 100])
+        self.assertListEqual(log_bins(1000)[-4:], [100, 200, 500, 1000])
+
+    def test_assembly_stats(self):
+        stats = AssemblyStats()
+        for L, gc in ((1000, 500), (500, 100), (200, 100), (200, 60),
+                      (100, 100)):
+            stats.add(L, gc)
+        obs = stats.summary()
+        self.assertDictEqual(obs, {
+            'sequences': 5, 'total_length': 2000, 'min_length': 100,
+            'max_length': 1000, 'mean_length': 400.0, 'N50': 1000, 'L50': 1,
+            'N90': 200, 'L90': 4, 'GC': 43.0,
+            'GC_distribution': {
+                'bins': [20, 30, 50, 99], 'sequences': [1, 1, 2, 1],
+                'bases': [500, 200, 1200, 100]},
+            'length_histogram': {
+                'bins': [100, 200, 500, 1000], 'sequences': [1, 2, 1, 1],
+                'bases': [100, 400, 500, 1000]}})
+        self.assertDictEqual(AssemblyStats().summary(), {
+            'sequences': 0, 'total_length': 0})
+
+
 if __name__ == "__main__":
     main()
@@ -84,6 +84,7 @@ fi
 /home/ark/MAB/bin/HoundSleuth/binstage.v2.sh -i ${DIR}/${input} -o ${OUT}/binarena/${input%.*} -D ${OUT}/binarena -b ${input%.*} -s ${OUT}/spraynpray/spraynpray.csv -m 1000 -r ${rank}
 
 mv ${OUT}/binarena/${input%.*}.taxa.tsv ${OUT}/data_table_for_binarena.tsv
+mv ${OUT}/binarena/${input%.*}.assembly_stats.json ${OUT}/assembly_stats.json
 mkdir -p ${OUT}/${rank}_level_bins
 mv ${OUT}/binarena/*fa ${OUT}/${rank}_level_bins
 mv ${OUT}/*fa ${OUT}/${rank}_level_bins